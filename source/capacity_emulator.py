@@ -0,0 +1,320 @@
+"""
+A surrogate of the national capacity over the parameters of the capacity
+error config, for what-if questions that are too slow to simulate.
+
+The emulator is a polynomial chaos expansion: each statistic of the
+national capacity (the mean and some quantiles) is fitted by least squares
+as a sum of products of Legendre polynomials of the parameters, scaled to
+[-1, 1] over their ranges, up to a total degree. It is trained on a Sobol
+design of configs, each simulated with the same seeds and p1 design (see
+`sensitivity_analysis.evaluate_configs`), and its error is estimated by
+k-fold cross-validation. A prediction is a few small array operations.
+
+The emulator, its training data and cross-validation errors are saved
+together in one .npz file.
+"""
+
+import json
+import itertools
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+from numpy.polynomial.legendre import legvander
+from capacity_error import CapacityError
+from sensitivity_analysis import config_parameters, parameter_bounds, \
+    set_parameters, evaluate_configs
+
+# the default statistics of the national capacity that are emulated
+EMULATOR_STATISTICS = ("mean", 0.01, 0.05, 0.5, 0.95, 0.99)
+
+
+def multi_indices(d, degree):
+    """
+    Return the exponents of the Legendre polynomials of each term of the
+    expansion, every product of d polynomials with a total degree of at
+    most `degree`.
+
+    Returns
+    -------
+    numpy.ndarray
+        A (terms, d) array of exponents, the constant term first.
+    """
+    indices = [np.zeros(d, dtype=np.int64)]
+    for total in range(1, degree + 1):
+        for dims in itertools.combinations_with_replacement(range(d), total):
+            index = np.zeros(d, dtype=np.int64)
+            np.add.at(index, list(dims), 1)
+            indices.append(index)
+    return np.array(indices)
+
+
+class CapacityEmulator:
+    """
+    A polynomial chaos expansion of statistics of the national capacity.
+    """
+
+    def __init__(self, parameters, bounds, statistics=EMULATOR_STATISTICS,
+                 degree=2):
+        """
+        Parameters
+        ----------
+        `parameters` : list
+            The names of the parameters, see
+            `sensitivity_analysis.config_parameters`.
+        `bounds` : numpy.ndarray
+            The (d, 2) lower and upper bounds of each parameter, over which
+            the emulator is trained.
+        `statistics` : tuple
+            The statistics of the national capacity, see
+            `sensitivity_analysis.summarise`.
+        `degree` : int
+            The total degree of the expansion.
+        """
+        self.parameters = list(parameters)
+        self.bounds = np.asarray(bounds, dtype=float).reshape(-1, 2)
+        self.statistics = tuple(statistics)
+        self.degree = int(degree)
+        self.indices = multi_indices(len(self.parameters), self.degree)
+        # orthonormal scaling of the Legendre polynomials on [-1, 1]
+        self.norms = np.sqrt(2 * np.arange(self.degree + 1) + 1)
+        self.coefficients = None
+        self.design = None
+        self.outputs = None
+        self.cv = None
+        self.metadata = {}
+
+    def scale(self, design):
+        """Map parameter values to [-1, 1] over their bounds."""
+        design = np.atleast_2d(np.asarray(design, dtype=float))
+        lower, upper = self.bounds[:, 0], self.bounds[:, 1]
+        return 2 * (design - lower) / (upper - lower) - 1
+
+    def basis(self, design):
+        """
+        Return the value of every term of the expansion at each design
+        point.
+
+        Returns
+        -------
+        numpy.ndarray
+            A (points, terms) array.
+        """
+        x = self.scale(design)
+        # (points, d, degree + 1) values of each polynomial of each parameter
+        values = legvander(x, self.degree) * self.norms
+        return values[:, np.arange(x.shape[1]), self.indices].prod(axis=2)
+
+    def fit(self, design, outputs):
+        """
+        Fit the expansion by least squares.
+
+        Parameters
+        ----------
+        `design` : numpy.ndarray
+            The (points, d) parameter values.
+        `outputs` : numpy.ndarray
+            The (points, statistics) values of the statistics.
+        """
+        basis = self.basis(design)
+        if basis.shape[0] < basis.shape[1]:
+            raise ValueError("The expansion has {} terms but only {} training "
+                             "points, please increase n_train or reduce the "
+                             "degree or number of parameters."
+                             .format(basis.shape[1], basis.shape[0]))
+        self.coefficients = np.linalg.lstsq(
+            basis, np.asarray(outputs, dtype=float), rcond=None
+        )[0]
+        return self
+
+    def cross_validate(self, design, outputs, n_folds=5, seed=None):
+        """
+        Estimate the prediction error by k-fold cross-validation.
+
+        Parameters
+        ----------
+        `design` : numpy.ndarray
+            The (points, d) parameter values.
+        `outputs` : numpy.ndarray
+            The (points, statistics) values of the statistics.
+        `n_folds` : int
+            The number of folds.
+        `seed` : int
+            The seed of the split into folds.
+        Returns
+        -------
+        pd.DataFrame
+            For each statistic, the root mean square and largest absolute
+            error (MW) of the predictions of the points left out, and Q2,
+            the share of the variance of the statistic they explain.
+        """
+        design = np.asarray(design, dtype=float)
+        outputs = np.asarray(outputs, dtype=float)
+        folds = np.random.default_rng(seed).permutation(
+            design.shape[0]) % n_folds
+        predictions = np.empty_like(outputs)
+        fold_model = CapacityEmulator(self.parameters, self.bounds,
+                                      self.statistics, self.degree)
+        for fold in range(n_folds):
+            test = folds == fold
+            fold_model.fit(design[~test], outputs[~test])
+            predictions[test] = fold_model.basis(design[test]) @ \
+                fold_model.coefficients
+        errors = predictions - outputs
+        self.cv = pd.DataFrame({
+            "rmse_MW": np.sqrt((errors ** 2).mean(axis=0)),
+            "max_error_MW": np.abs(errors).max(axis=0),
+            "q2": 1 - (errors ** 2).mean(axis=0) / outputs.var(axis=0),
+        }, index=pd.Index([str(s) for s in self.statistics],
+                          name="statistic"))
+        return self.cv
+
+    def predict(self, values):
+        """
+        Return the emulated statistics of the national capacity.
+
+        Parameters
+        ----------
+        `values` : dict or numpy.ndarray
+            The value of each parameter keyed by name, or a (points, d)
+            array of them in the order of `parameters`.
+        Returns
+        -------
+        dict or numpy.ndarray
+            For a dict, the value of each statistic keyed by statistic,
+            otherwise a (points, statistics) array.
+        """
+        if self.coefficients is None:
+            raise Exception("The emulator has not been fitted.")
+        if isinstance(values, dict):
+            design = np.array([[values[p] for p in self.parameters]])
+        else:
+            design = np.atleast_2d(np.asarray(values, dtype=float))
+        x = self.scale(design)
+        if np.any(np.abs(x) > 1 + 1e-9):
+            raise ValueError("The parameters are outside the bounds the "
+                             "emulator was trained on.")
+        predictions = self.basis(design) @ self.coefficients
+        if isinstance(values, dict):
+            return dict(zip(self.statistics, predictions[0].tolist()))
+        return predictions
+
+    def save(self, file):
+        """Save the emulator, its training data and errors to an .npz file."""
+        metadata = dict(self.metadata, parameters=self.parameters,
+                        statistics=list(self.statistics), degree=self.degree)
+        arrays = {"bounds": self.bounds, "coefficients": self.coefficients,
+                  "metadata": np.array(json.dumps(metadata))}
+        if self.design is not None:
+            arrays.update(design=self.design, outputs=self.outputs)
+        if self.cv is not None:
+            arrays["cv"] = self.cv.to_numpy()
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """Load an emulator saved with `save`."""
+        with np.load(file) as data:
+            entry = {key: data[key] for key in data.files}
+        metadata = json.loads(str(entry["metadata"]))
+        self = cls(metadata.pop("parameters"), entry["bounds"],
+                   statistics=metadata.pop("statistics"),
+                   degree=metadata.pop("degree"))
+        self.metadata = metadata
+        self.coefficients = entry["coefficients"]
+        self.design = entry.get("design")
+        self.outputs = entry.get("outputs")
+        if "cv" in entry:
+            self.cv = pd.DataFrame(entry["cv"],
+                                   columns=["rmse_MW", "max_error_MW", "q2"],
+                                   index=pd.Index([str(s) for s in
+                                                   self.statistics],
+                                                  name="statistic"))
+        return self
+
+
+def train_emulator(base, capacity_error=None, parameters=None, bounds=None,
+                   spread=0.2, degree=2, n_train=None, n_simulations=50,
+                   statistics=EMULATOR_STATISTICS, seed=None, n_folds=5,
+                   sampling="latin_hypercube", workers=1, **options):
+    """
+    Train an emulator on a Sobol design of capacity error configs.
+
+    Parameters
+    ----------
+    `base` : BaseSiteList
+        The site list.
+    `capacity_error` : CapacityError
+        The config whose parameters are varied, by default loaded from
+        'Config/capacity_error.txt'.
+    `parameters` : list
+        The names of the parameters, by default every parameter of the
+        random pdfs, see `sensitivity_analysis.config_parameters`.
+    `bounds` : dict
+        Optionally the (lower, upper) bounds of parameters keyed by name,
+        the others are varied by +/- `spread` of their value.
+    `spread` : float
+        The relative range of the parameters without bounds.
+    `degree` : int
+        The total degree of the expansion.
+    `n_train` : int
+        The number of training configs, by default the power of 2 at
+        least twice the number of terms of the expansion.
+    `n_simulations` : int
+        The number of simulations of each config.
+    `statistics` : tuple
+        The statistics of the national capacity to emulate.
+    `seed` : int
+        The seed of the design, the simulations and the folds.
+    `n_folds` : int
+        The number of cross-validation folds.
+    `sampling` : string
+        The design of the p1 parameters of the simulations.
+    `workers` : int
+        The number of processes simulating the configs.
+    `options` : dict
+        The engine options, see `simulate_national_capacities`,
+        keyed_streams defaults to True as in the SensitivityAnalysis.
+    Returns
+    -------
+    CapacityEmulator
+    """
+    ce = CapacityError() if capacity_error is None else capacity_error
+    parameters = config_parameters(ce.config) if parameters is None \
+        else list(parameters)
+    emulator = CapacityEmulator(parameters,
+                                parameter_bounds(ce.config, parameters,
+                                                 bounds, spread),
+                                statistics=statistics, degree=degree)
+    if n_train is None:
+        # a power of 2 keeps the balance of the Sobol points
+        n_train = 2 ** int(np.ceil(np.log2(2 * emulator.indices.shape[0])))
+    rng = np.random.default_rng(seed)
+    seeds = [int(s) for s in rng.choice(2 ** 32, size=n_simulations,
+                                        replace=False)]
+    design = qmc.scale(qmc.Sobol(len(parameters), scramble=True,
+                                 seed=rng.integers(2 ** 32)).random(n_train),
+                       emulator.bounds[:, 0], emulator.bounds[:, 1])
+    options.setdefault("keyed_streams", True)
+    outputs = evaluate_configs(
+        [set_parameters(ce.config, dict(zip(parameters, row)))
+         for row in design],
+        seeds, base, statistics=statistics, sampling=sampling,
+        workers=workers, **options
+    )
+    emulator.design, emulator.outputs = design, outputs
+    emulator.metadata = {"site_list": base.checksum(),
+                         "capacity_error": ce.checksum(),
+                         "n_simulations": n_simulations}
+    emulator.cross_validate(design, outputs, n_folds=n_folds,
+                            seed=rng.integers(2 ** 32))
+    return emulator.fit(design, outputs)
+
+
+if __name__ == "__main__":
+    from site_list_variation import BaseSiteList
+    emulator = train_emulator(BaseSiteList(),
+                              parameters=["offline.domestic.p1.mean",
+                                          "offline.non_domestic.p1.mean"],
+                              seed=1)
+    print(emulator.cv)
+    emulator.save("../data/capacity_emulator.npz")
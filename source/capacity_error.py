@@ -1,18 +1,105 @@
 import json
 import os
+import hashlib
 import errno
 import numpy as np
-from scipy.stats import johnsonsu
 from scipy.stats import truncnorm
+from scipy.special import ndtr, ndtri
+
+# errors whose effect is added to the capacity (kW) rather than scaling it,
+# with the bounds of their effect pdf
+ADDITIVE_ERRORS = {("site_uncertainty", "domestic"): (0, 1)}
+
+
+class ConstantSampler:
+    """A sampler for the "uniform" pdf, which is a constant value."""
+
+    def __init__(self, value):
+        self.value = float(value)
+
+    def ppf(self, u):
+        return np.full(shape=np.shape(u), fill_value=self.value)
+
+    def sample(self, size, rng):
+        return np.full(shape=size, fill_value=self.value)
+
+
+class TruncatedNormalSampler:
+    """
+    A sampler for a truncated normal pdf by its inverse cdf, with the
+    truncation constants computed once.
+    """
+
+    def __init__(self, mean, sd, bounds=(-1, 1)):
+        self.mean = mean
+        self.sd = sd
+        a, b = (bounds[0] - mean) / sd, (bounds[1] - mean) / sd
+        # work in the lower tail for precision if both bounds are above the
+        # mean, mirroring the draws back afterwards
+        self.mirror = a > 0
+        if self.mirror:
+            a, b = -b, -a
+        self.cdf_a = ndtr(a)
+        self.cdf_width = ndtr(b) - self.cdf_a
+
+    def ppf(self, u):
+        u = np.asarray(u, dtype=float)
+        if self.mirror:
+            z = -ndtri(self.cdf_a + (1 - u) * self.cdf_width)
+        else:
+            z = ndtri(self.cdf_a + u * self.cdf_width)
+        return self.mean + self.sd * z
+
+    def sample(self, size, rng):
+        return self.ppf(rng.random(size))
+
+
+class JohnsonSUSampler:
+    """
+    A sampler for a truncated Johnson SU pdf by its inverse cdf.
+
+    A Johnson SU variable is x = loc + scale * sinh((z - a) / b) for a
+    standard normal z, so the bounds on x are mapped to bounds on z and z is
+    drawn from the truncated standard normal, in one pass for any size.
+    """
+
+    def __init__(self, a, b, loc, scale, bounds=(-100, 100), divisor=100):
+        self.a = a
+        self.b = b
+        self.loc = loc
+        self.scale = scale
+        self.divisor = divisor
+        z_bounds = [a + b * np.arcsinh((bound - loc) / scale)
+                    for bound in bounds]
+        self.z = TruncatedNormalSampler(0, 1, bounds=z_bounds)
+
+    def ppf(self, u):
+        z = self.z.ppf(u)
+        x = self.loc + self.scale * np.sinh((z - self.a) / self.b)
+        return x / self.divisor
+
+    def sample(self, size, rng):
+        return self.ppf(rng.random(size))
+
 
 class CapacityError:
     """
     A class to estimate the error associated with each capacity error type.
     """
 
-    def __init__(self):
-        self.config = self.load_config("Config/capacity_error.txt")
+    def __init__(self, config=None):
+        """
+        Parameters
+        ----------
+        `config` : dict
+            Optionally provide the capacity error config, otherwise it is
+            loaded from 'Config/capacity_error.txt'.
+        """
+        self.config = self.load_config("Config/capacity_error.txt") \
+            if config is None else config
         # self.jsu = None
+        self.samplers = {}
+        self.compile_samplers()
 
     @staticmethod
     def load_config(file_location=None):
@@ -32,22 +119,104 @@ class CapacityError:
                                  "the required values.".format(file_location))
         return config
 
-    def error_pdf(self, system_type, order=None, _error=None, size=1, bounds =(-1,1)):
-        """A wrapper function to call the required pdf function."""
+    def checksum(self):
+        """Return a hash of the config, to identify the results it produced."""
+        text = json.dumps(self.config, sort_keys=True)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def compile_samplers(self):
+        """
+        Build a sampler for every pdf in the config, with the default bounds.
+        """
+        for _error, entry in self.config.items():
+            if _error == "unreported":
+                continue
+            for system_type, orders in entry.items():
+                for order in orders:
+                    self.sampler(system_type, order, _error)
+
+    def sampler(self, system_type, order=None, _error=None, bounds=(-1,1)):
+        """
+        Return the compiled sampler of a pdf in the config.
+
+        Samplers are built on first use for each set of bounds and cached.
+
+        Returns
+        -------
+        object, a sampler with `sample(size, rng)` and `ppf(u)` methods.
+        """
+        key = (_error, system_type, order, tuple(bounds))
+        if key in self.samplers:
+            return self.samplers[key]
+        pdf, params = self.config[_error][system_type][order]
+        if pdf == "normal":
+            sampler = TruncatedNormalSampler(*params, bounds=bounds)
+        elif pdf == "uniform":
+            if len(params) != 1:
+                raise ValueError("Error in value of uniform pdf at: {}, {}, {}"
+                                 .format(_error, system_type, order))
+            sampler = ConstantSampler(params[0])
+        elif pdf == "johnson_su":
+            a, b, location, _scale, jsu_bounds = params
+            sampler = JohnsonSUSampler(a, b, location, _scale,
+                                       bounds=jsu_bounds)
+        else:
+            raise ValueError("Incorrect pdf name in the config file at: "
+                             "{}, {}, {}".format(_error, system_type, order))
+        self.samplers[key] = sampler
+        return sampler
+
+    def error_pdf(self, system_type, order=None, _error=None, size=1, bounds =(-1,1),
+                  random_state=None):
+        """
+        A wrapper function to call the required pdf function.
+
+        `random_state` optionally provides a numpy Generator to draw from
+        with the compiled samplers, otherwise the global numpy random state
+        is used with the scipy pdfs. The scipy pdfs are kept for the global
+        random state, so that its simulations stay identical for a seed.
+        """
+
+        if isinstance(random_state, np.random.Generator):
+            return self.sampler(system_type, order, _error, bounds).sample(
+                size, random_state)
 
         pdf = self.config[_error][system_type][order][0]
 
         if pdf == "normal":
-            return self.normal_pdf(system_type, order, _error, size, bounds)
+            return self.normal_pdf(system_type, order, _error, size, bounds,
+                                   random_state=random_state)
         elif pdf == "uniform":
             return self.uniform_pdf(system_type, order, _error, size)
         elif pdf == "johnson_su":
-            return self.johnson_su_pdf(system_type, order, _error, size)
+            return self.johnson_su_pdf(system_type, order, _error, size,
+                                       random_state=random_state)
         else:
             raise ValueError("Incorrect pdf name in the config file at: "
                              "{}, {}, {}".format(_error, system_type, order))
 
-    def normal_pdf(self, system_type, order=None, _error=None, size=1, bounds=(-1,1)):
+    def error_ppf(self, system_type, u, order=None, _error=None, bounds=(-1,1)):
+        """
+        Map uniform random numbers to draws from the required pdf by its
+        inverse cumulative distribution function.
+
+        Parameters
+        ----------
+        system_type
+        u: numpy.ndarray,
+            Uniform random numbers in [0, 1).
+        order
+        _error
+        bounds
+
+        Returns
+        -------
+        numpy.ndarray, the draws, of the same shape as `u`.
+        """
+        return self.sampler(system_type, order, _error, bounds).ppf(u)
+
+    def normal_pdf(self, system_type, order=None, _error=None, size=1, bounds=(-1,1),
+                   random_state=None):
         """
 
         Parameters
@@ -62,7 +231,8 @@ class CapacityError:
 
         """
         params = self.config[_error][system_type][order][1]
-        return self.get_truncated_normal(*params, bounds=bounds, size=size)
+        return self.get_truncated_normal(*params, bounds=bounds, size=size,
+                                         random_state=random_state)
 
     def uniform_pdf(self, system_type, order=None, _error=None, size=1):
         """
@@ -84,32 +254,33 @@ class CapacityError:
             raise ValueError("Error in value of uniform pdf at: {}, {}, {}"
                              .format(_error, system_type, order))
 
-    def johnson_su_pdf(self, system_type, order=None, _error=None, size=1):
+    def johnson_su_pdf(self, system_type, order=None, _error=None, size=1,
+                       random_state=None):
         """
+        Draw from the Johnson SU pdf truncated to the bounds in the config,
+        as a fraction rather than a percentage.
 
         Parameters
         ----------
         system_type
         order
         _error
+        size
+        random_state
 
         Returns
         -------
-
+        numpy.ndarray, the draws.
         """
-        params = self.config[_error][system_type][order][1]
-        shape, shape, location, _scale, bounds = params
-        rv = johnsonsu.rvs(shape, shape, loc=location, scale=_scale, size=size)
-
-        import pdb; pdb.set_trace()
-        while not ((-100 < rv) & (rv < 100)):
-            rv = johnsonsu.rvs(shape, shape, loc=location, scale=_scale, size=size)
-        return rv / 100
+        sampler = self.sampler(system_type, order, _error)
+        if random_state is None:
+            return sampler.ppf(np.random.random_sample(size))
+        return sampler.ppf(random_state.random(size))
 
 
 
     @staticmethod
-    def get_truncated_normal(mean, sd, size=1, bounds=(-1,1)):
+    def get_truncated_normal(mean, sd, size=1, bounds=(-1,1), random_state=None):
         """
 
         A function to return a scipy object for a truncated normal pdf.
@@ -125,6 +296,8 @@ class CapacityError:
         upp: float,
             The upper boundary of the pdf.
         size:
+        random_state: numpy.random.Generator,
+            Optionally the generator to draw from.
 
         Returns
         -------
@@ -134,7 +307,8 @@ class CapacityError:
         upp = bounds[1]
 
         a, b = (low - mean) / sd, (upp - mean) / sd
-        return truncnorm.rvs(a, b, loc=mean, scale=sd, size=size)
+        return truncnorm.rvs(a, b, loc=mean, scale=sd, size=size,
+                             random_state=random_state)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,305 @@
+"""
+An analytic approximation of the distribution of the national capacity,
+computed from the capacity error config and sums over the site list in
+milliseconds, as a preview of a Monte Carlo run.
+
+Given the p1 parameters of a simulation, every site is independent and each
+error stage either multiplies its capacity by (1 + p2) or adds p2 with
+probability p1, so the first two moments of a site's capacity are a
+quadratic in its base capacity. Summing over the site list then only needs
+the count, sum and sum of squares of the capacities of each system type,
+and of each capacity band of the unreported sites, which are sampled
+without replacement. The moments are averaged over the p1 parameters by
+quasi Monte Carlo, treating the national capacity as normal given p1.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, johnsonsu, kstest
+from scipy.optimize import least_squares
+from capacity_error import ADDITIVE_ERRORS
+from random_streams import SYSTEM_TYPE_CODES
+from site_list_variation import ERROR_STAGES
+from sampling_designs import p1_dimensions, uniform_design
+from online_stats import weighted_quantile_index
+
+
+class CapacityMoments:
+    """
+    The moments and approximate distribution of the national capacity.
+    """
+
+    def __init__(self, base, capacity_error, n_points=4096, seed=0):
+        """
+        Parameters
+        ----------
+        `base` : BaseSiteList
+            The site list.
+        `capacity_error` : CapacityError
+            The capacity error config.
+        `n_points` : int
+            The number of scrambled Sobol points over the p1 parameters.
+        `seed` : int
+            The seed of the Sobol points.
+        """
+        self.base = base
+        self.ce = capacity_error
+        self.n_points = int(n_points)
+        self.seed = seed
+        self.sums = self.site_sums()
+        self._moments = None
+
+    def site_sums(self):
+        """
+        Return the count, sum and sum of squares of the capacities of each
+        system type, for the site list ("base") and for each unreported
+        capacity band, from which the unreported sites are sampled.
+
+        Returns
+        -------
+        dict
+            (count, sum, sum of squares) keyed by (group, system type).
+        """
+        capacity = np.asarray(self.base.capacity, dtype=np.float64)
+        codes = self.base.system_type_code
+        groups = {"base": np.arange(capacity.shape[0])}
+        groups.update(self.base.band_indices())
+        sums = {}
+        for group, rows in groups.items():
+            for system_type, code in SYSTEM_TYPE_CODES.items():
+                c = capacity[rows[codes[rows] == code]]
+                sums[(group, system_type)] = (c.shape[0], c.sum(),
+                                              (c ** 2).sum())
+        return sums
+
+    def effect_moments(self, system_type, error):
+        """Return the mean and mean square of the effect (p2) of an error."""
+        u = (np.arange(20000) + 0.5) / 20000
+        bounds = ADDITIVE_ERRORS.get((error, system_type), (-1, 1))
+        effect = self.ce.error_ppf(system_type, u, order="p2", _error=error,
+                                   bounds=bounds)
+        return effect.mean(), (effect ** 2).mean()
+
+    def probabilities(self):
+        """
+        Return the p1 parameters at each Sobol point, clipped to [0, 1].
+
+        Returns
+        -------
+        dict
+            Arrays of p1 keyed by (error category, system type).
+        """
+        dimensions = p1_dimensions(self.ce.config)
+        design = uniform_design("sobol", self.n_points, len(dimensions),
+                                seed=self.seed, replicates=1)
+        probabilities = {}
+        for error in ERROR_STAGES:
+            for system_type in SYSTEM_TYPE_CODES:
+                if (error, system_type) in dimensions:
+                    u = design[:, dimensions.index((error, system_type))]
+                else:
+                    u = np.full(self.n_points, 0.5)
+                p1 = self.ce.error_ppf(system_type, u, order="p1",
+                                       _error=error)
+                probabilities[(error, system_type)] = np.clip(p1, 0, 1)
+        return probabilities
+
+    def coefficients(self, system_type, probabilities):
+        """
+        Return the coefficients of the conditional moments of a site of a
+        system type at each Sobol point, such that for base capacity c
+        E[X] = alpha c + beta and E[X^2] = gamma c^2 + delta c + epsilon.
+        """
+        alpha, beta = np.ones(self.n_points), np.zeros(self.n_points)
+        gamma, delta, epsilon = np.ones(self.n_points), \
+            np.zeros(self.n_points), np.zeros(self.n_points)
+        for error in ERROR_STAGES:
+            p = probabilities[(error, system_type)]
+            mean, mean_square = self.effect_moments(system_type, error)
+            if (error, system_type) in ADDITIVE_ERRORS:
+                # X + B a, with B ~ Bernoulli(p)
+                delta = delta + 2 * alpha * p * mean
+                epsilon = epsilon + 2 * beta * p * mean + p * mean_square
+                beta = beta + p * mean
+            else:
+                # X (1 + B e)
+                first = 1 + p * mean
+                second = 1 + 2 * p * mean + p * mean_square
+                alpha, beta = alpha * first, beta * first
+                gamma, delta, epsilon = gamma * second, delta * second, \
+                    epsilon * second
+        return alpha, beta, gamma, delta, epsilon
+
+    def conditional_moments(self):
+        """
+        Return the mean and variance of the national capacity given the p1
+        parameters, at each Sobol point.
+        """
+        probabilities = self.probabilities()
+        coefficients = {system_type: self.coefficients(system_type,
+                                                       probabilities)
+                        for system_type in SYSTEM_TYPE_CODES}
+
+        def group_sums(group):
+            # the sums over a group of the conditional mean (f), its square
+            # and the conditional variance of each site
+            f, f2, v = 0, 0, 0
+            for system_type, (alpha, beta, gamma, delta, epsilon) in \
+                    coefficients.items():
+                n, s1, s2 = self.sums[(group, system_type)]
+                f = f + alpha * s1 + beta * n
+                f2 = f2 + alpha ** 2 * s2 + 2 * alpha * beta * s1 + \
+                    beta ** 2 * n
+                v = v + gamma * s2 + delta * s1 + epsilon * n
+            return f, f2, v - f2
+
+        mean, f2, variance = group_sums("base")
+        for band, k in self.ce.config["unreported"].items():
+            k = int(k)
+            N = sum(self.sums[(band, system_type)][0]
+                    for system_type in SYSTEM_TYPE_CODES)
+            if N == 0 or k == 0:
+                continue
+            f, f2, v = group_sums(band)
+            # a sample of k sites drawn without replacement from N
+            mean = mean + k * f / N
+            variance = variance + k * v / N + \
+                k * (N - k) / max(N - 1, 1) * (f2 / N - (f / N) ** 2)
+        return mean, variance
+
+    def moments(self):
+        """
+        Return the moments of the national capacity.
+
+        Returns
+        -------
+        dict
+            The mean, standard deviation, skewness and excess kurtosis.
+        """
+        if self._moments is None:
+            m, v = self.conditional_moments()
+            mean = m.mean()
+            d = m - mean
+            variance = (d ** 2 + v).mean()
+            third = (d ** 3 + 3 * d * v).mean()
+            fourth = (d ** 4 + 6 * d ** 2 * v + 3 * v ** 2).mean()
+            self._moments = {"mean": mean, "std": math.sqrt(variance),
+                             "skewness": third / variance ** 1.5,
+                             "kurtosis": fourth / variance ** 2 - 3}
+        return self._moments
+
+    def distribution(self, kind="johnsonsu"):
+        """
+        Return an approximate distribution of the national capacity.
+
+        Parameters
+        ----------
+        `kind` : string
+            "normal", or "johnsonsu" to also match the skewness and
+            kurtosis, falling back to the normal if no Johnson SU
+            distribution has them.
+        Returns
+        -------
+        scipy.stats frozen distribution
+        """
+        moments = self.moments()
+        if kind == "johnsonsu":
+            fit = johnson_su_from_moments(**moments)
+            if fit is not None:
+                return fit
+        elif kind != "normal":
+            raise ValueError("Unknown distribution {}, expected \"normal\" "
+                             "or \"johnsonsu\"".format(kind))
+        return norm(loc=moments["mean"], scale=moments["std"])
+
+    def quantiles(self, quantiles=(0.01, 0.25, 0.5, 0.75, 0.99),
+                  kind="johnsonsu"):
+        """Return the approximate quantiles of the national capacity."""
+        distribution = self.distribution(kind)
+        return {q: float(distribution.ppf(q)) for q in quantiles}
+
+
+def johnson_su_from_moments(mean, std, skewness, kurtosis):
+    """
+    Return the Johnson SU distribution with the given moments, or None if
+    there is none.
+
+    The shape parameters are found numerically to match the skewness and
+    excess kurtosis, then the location and scale to match the mean and
+    standard deviation.
+    """
+    def residuals(x):
+        a, log_b = x
+        _, _, s, k = johnsonsu.stats(a, math.exp(log_b), moments="mvsk")
+        return [float(s) - skewness, float(k) - kurtosis]
+
+    fit = least_squares(residuals, x0=[-np.sign(skewness), math.log(2.)],
+                        bounds=([-20, math.log(0.3)], [20, math.log(100.)]))
+    if not np.allclose(fit.fun, 0, atol=1e-4):
+        return None
+    a, b = fit.x[0], math.exp(fit.x[1])
+    m, v = johnsonsu.stats(a, b, moments="mv")
+    scale = std / math.sqrt(float(v))
+    return johnsonsu(a, b, loc=mean - scale * float(m), scale=scale)
+
+
+def validate(moments, results, quantiles=(0.01, 0.25, 0.5, 0.75, 0.99),
+             kind="johnsonsu"):
+    """
+    Compare the analytic approximation with the results of a Monte Carlo
+    run.
+
+    Parameters
+    ----------
+    `moments` : CapacityMoments
+        The analytic approximation.
+    `results` : pd.DataFrame
+        The Monte Carlo results, see `results_store.load_results`.
+    `quantiles` : tuple
+        The quantiles to compare.
+    `kind` : string
+        The approximate distribution, see `CapacityMoments.distribution`.
+    Returns
+    -------
+    pd.DataFrame
+        The analytic and Monte Carlo estimate of each statistic, and for
+        the mean the number of standard errors between them. The last row
+        is the Kolmogorov-Smirnov statistic of the results against the
+        approximate distribution, and its p value.
+    """
+    values = results["national_capacity_MW"].to_numpy(dtype=float)
+    weights = results["weight"].to_numpy(dtype=float) \
+        if "weight" in results else np.ones(values.shape[0])
+    total = weights.sum()
+    mc_mean = (weights * values).sum() / total
+    mc_std = math.sqrt((weights * (values - mc_mean) ** 2).sum() / total)
+    effective_count = total ** 2 / (weights ** 2).sum()
+    analytic = moments.moments()
+    rows = [("mean", analytic["mean"], mc_mean,
+             (analytic["mean"] - mc_mean) /
+             (mc_std / math.sqrt(effective_count))),
+            ("std", analytic["std"], mc_std, np.nan)]
+    approximate = moments.quantiles(quantiles, kind)
+    for q in quantiles:
+        rows.append(("q{}".format(q), approximate[q],
+                     values[weighted_quantile_index(values, weights, q)],
+                     np.nan))
+    # the KS test assumes equally weighted results
+    if np.all(weights == weights[0]):
+        ks = kstest(values, moments.distribution(kind).cdf)
+        rows.append(("ks", ks.statistic, ks.pvalue, np.nan))
+    return pd.DataFrame(rows, columns=["statistic", "analytic", "monte_carlo",
+                                       "standard_errors"])
+
+
+if __name__ == "__main__":
+    import sys
+    from site_list_variation import BaseSiteList
+    from capacity_error import CapacityError
+    from results_store import load_results
+    self = CapacityMoments(BaseSiteList(), CapacityError())
+    print(self.moments())
+    print(self.quantiles())
+    if len(sys.argv) > 1:
+        print(validate(self, load_results(sys.argv[1])))
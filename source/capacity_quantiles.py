@@ -7,8 +7,16 @@ A script to select boxplot quantile data from the capacity
  - Owen Huxley <othuxley1@sheffield.ac.uk>
 """
 
+import os
 import pandas as pd
-from site_list_variation import SiteListVariation
+import numpy as np
+from site_list_variation import SiteListVariation, BaseSiteList
+from capacity_error import CapacityError
+from results_store import load_results, ResultsStore
+from site_list_monte_carlo_simuation import reconstruct_simulation, \
+    simulation_parameters
+from outcome_archive import OutcomeArchive
+from online_stats import weighted_quantile_index
 from dbconnector import DBConnector
 from generic_tools import cached
 
@@ -28,12 +36,13 @@ class CapacitySitelistUploader:
             "0.75" : "solarsite_20190205_t0only_no_unreported_0.75pc",
             "0.99" : "solarsite_20190205_t0only_no_unreported_0.99pc"
         }
+        # threads rebuilding each site list of a keyed streams run
+        self.threads = os.cpu_count() or 1
         ##############
     
     def run(self):
 
-        data = pd.read_csv(self.capacity_file)
-        data.rename({" national_capacity (MW)": "national_capacity_MW"}, inplace=True, axis=1)
+        data = load_results(self.capacity_file)
 
         site_lists = self.get_site_lists(data)
         return
@@ -52,6 +61,12 @@ class CapacitySitelistUploader:
             A list of dataframes containing the quantiles: .01, .25, .5, .75, .99
         """
         def idxquantile(s, q=0.5, *args, **kwargs):
+            # results of importance sampling runs are weighted, the others
+            # have a weight of 1
+            if "weight" in data and not np.allclose(data["weight"], 1):
+                return [data.index[weighted_quantile_index(
+                    data["national_capacity_MW"], data["weight"], q
+                )]]
             qv = s.quantile(q, *args, **kwargs)
             return (s.sort_values(by="national_capacity_MW")[::-1] <= qv).idxmax()
 
@@ -72,31 +87,59 @@ class CapacitySitelistUploader:
     def get_site_lists(self, data):
         site_lists = {}
         seed_data = self.get_quantile_seeds(data)
+        # results in a ResultsStore are rebuilt from the run manifest, and
+        # archived alongside the results so they are only rebuilt once,
+        # older csv results by re-running the SiteListVariation
+        manifest = ResultsStore(self.capacity_file).read_manifest() \
+            if os.path.isdir(self.capacity_file) else None
+        if manifest is not None:
+            base = BaseSiteList()
+            capacity_error = CapacityError()
+            archive = OutcomeArchive(
+                os.path.join(self.capacity_file, "archive"), base,
+                capacity_error
+            )
         # import pdb; pdb.set_trace()
         for i, quantile in enumerate(seed_data):
             seed_df = seed_data[quantile]
             # import pdb; pdb.set_trace()
-            instance = SiteListVariation(1, verbose=True, seed=int(seed_df.values[0][0]), test=False)
-            # instance.unreported_systems()
-            instance.simulate_effective_capacity_site_list()
-            nc = instance.SL.Capacity.sum()
-            if not int(nc) == int(seed_df.values[0][1]):
-                print("50th percentile is: {}, capacity from results is: {}"
-                      .format(nc, seed_df.values[0][1]))
-                raise ValueError("National capacity of site list does not national"
-                                 "capacity from results.")
+            if manifest is not None:
+                seed = int(seed_df.values[0][0])
+                if seed not in archive:
+                    rows, capacity, nc = reconstruct_simulation(
+                        seed, manifest, base, capacity_error,
+                        national_capacity=seed_df.values[0][1],
+                        threads=self.threads
+                    )
+                    archive.add(seed, rows, capacity,
+                                options=manifest["options"],
+                                parameters=simulation_parameters(
+                                    seed, manifest, capacity_error))
+                SL = archive.site_list(seed)
+                nc = SL["Capacity"].sum()
+            else:
+                instance = SiteListVariation(1, verbose=True, seed=int(seed_df.values[0][0]), test=False)
+                # instance.unreported_systems()
+                instance.simulate_effective_capacity_site_list()
+                nc = instance.national_capacity()
+                if not int(nc) == int(seed_df.values[0][1]):
+                    print("50th percentile is: {}, capacity from results is: {}"
+                          .format(nc, seed_df.values[0][1]))
+                    raise ValueError("National capacity of site list does not national"
+                                     "capacity from results.")
+                SL = instance.SL
             # hanndle missing location data
             # import pdb; pdb.set_trace()
             
             ################################
-            instance.SL.reset_index(inplace=True)
-            instance.SL.rename({"install_date": "installdate",
-                                "Capacity" : "installedcapacity"},
-                               inplace=True, axis=1)
-            instance.SL["latitude_rounded"] = instance.SL["latitude"].round(decimals=1)
-            instance.SL["longitude_rounded"] = instance.SL["longitude"].round(decimals=1)
-            instance.SL["gen_id"] = instance.SL.index + 1
-            db_SL = instance.SL[["gen_id", "latitude", "longitude",
+            SL.reset_index(inplace=True)
+            SL.rename({"install_date": "installdate",
+                       "Capacity" : "installedcapacity"},
+                      inplace=True, axis=1)
+            SL["latitude_rounded"] = SL["latitude"].round(decimals=1)
+            SL["longitude_rounded"] = SL["longitude"].round(decimals=1)
+            SL["gen_id"] = SL.index + 1
+            db_SL = SL[["gen_id", "latitude", "longitude",
                                  "latitude_rounded", "longitude_rounded",
                                  "installdate", "installedcapacity"]].copy()
             unlocated = db_SL[db_SL.isnull().any(axis=1)][["latitude", "longitude"]]
@@ -0,0 +1,105 @@
+"""
+The kernels that apply an error stage to the capacity array of a site list
+simulation, with an optional Numba backend.
+
+A stage tests every site of each system type against the probability of the
+error occurring, then multiplies the capacity of the sites it affects by the
+effect of the error, or adds the effect for additive errors. The NumPy kernel
+makes several passes over the arrays for this (comparison, mask, gather,
+multiply, scatter and the test for negative capacities), the Numba kernel a
+single loop over the sites. Both apply the same floating point operations
+to each site, so they give identical capacities.
+
+Numba is optional, without it the NumPy kernel is used.
+"""
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+KERNEL_BACKENDS = ("auto", "numpy", "numba")
+
+
+def apply_stage_numpy(capacity, codes, random_numbers, probabilities, effects,
+                      additive):
+    """
+    Apply an error stage to the capacity array in place.
+
+    Parameters
+    ----------
+    `capacity` : numpy.ndarray
+        The capacity of every site.
+    `codes` : numpy.ndarray
+        The system type code of every site, -1 where it has none.
+    `random_numbers` : numpy.ndarray
+        A (system types, sites) array of the uniform random numbers that
+        decide whether the error occurs at each site.
+    `probabilities` : numpy.ndarray
+        The probability of the error occurring for each system type.
+    `effects` : numpy.ndarray
+        A (system types, sites) array of the factor by which the error
+        multiplies the capacity, or the amount it adds.
+    `additive` : numpy.ndarray
+        Whether the error adds its effect, for each system type.
+    Returns
+    -------
+    bool
+        Whether any capacity is negative after the stage.
+    """
+    for code in range(probabilities.shape[0]):
+        mask = (codes == code) & (random_numbers[code] < probabilities[code])
+        if additive[code]:
+            capacity[mask] += effects[code][mask]
+        else:
+            capacity[mask] *= effects[code][mask]
+    return bool((capacity < 0).any())
+
+
+def apply_stage_loop(capacity, codes, random_numbers, probabilities, effects,
+                     additive):
+    """
+    Apply an error stage to the capacity array in place, in one loop over
+    the sites, see `apply_stage_numpy`. This is the source of the Numba
+    kernel, and is very slow uncompiled.
+    """
+    negative = False
+    for i in range(capacity.shape[0]):
+        code = codes[i]
+        if code >= 0 and random_numbers[code, i] < probabilities[code]:
+            if additive[code]:
+                capacity[i] += effects[code, i]
+            else:
+                capacity[i] *= effects[code, i]
+        if capacity[i] < 0:
+            negative = True
+    return negative
+
+
+apply_stage_numba = None if numba is None else \
+    numba.njit(cache=True, nogil=True)(apply_stage_loop)
+
+
+def stage_kernel(backend="auto"):
+    """
+    Return the kernel that applies an error stage.
+
+    Parameters
+    ----------
+    `backend` : string
+        "numpy", "numba", or "auto" for Numba if it is installed, otherwise
+        NumPy.
+    Returns
+    -------
+    function
+        See `apply_stage_numpy`.
+    """
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError("Unknown kernel backend {}, expected one of {}"
+                         .format(backend, KERNEL_BACKENDS))
+    if backend == "numpy" or (backend == "auto" and numba is None):
+        return apply_stage_numpy
+    if numba is None:
+        raise ImportError("The numba kernel backend requires numba, please "
+                          "install it or use the numpy backend.")
+    return apply_stage_numba
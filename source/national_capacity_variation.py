@@ -0,0 +1,276 @@
+"""
+A fast path for the site list variation when only the national capacity
+is needed.
+
+Rather than drawing a random number for every site, the number of sites
+affected by each error is drawn from a binomial distribution and that many
+sites are chosen at random, which has the same distribution as testing
+each site independently. Only the capacities of the sites that have been
+changed are stored, so the cost of each stage scales with the number of
+sites it affects rather than the size of the site list. The changes of a
+stage are merged into the stored capacities once, after every system type.
+An error that affects every site of a system type, such as the domestic
+site uncertainty, needs no sampling, and from then on the capacities of
+that system type are stored as one dense array.
+"""
+
+import numpy as np
+from capacity_error import CapacityError
+from random_streams import SYSTEM_TYPE_CODES
+from site_list_variation import BaseSiteList, ERROR_STAGES
+
+
+class NationalCapacityVariation:
+    """
+    Simulating the national capacity of the site list in accordance with
+    the categorised errors, without building the per-site site list.
+    """
+
+    def __init__(self, seed=1, verbose=False, base=None, capacity_error=None,
+                 parameters=None):
+        """
+        Parameters
+        ----------
+        `seed` : int
+            The seed for the numpy random number generator.
+        `base` : BaseSiteList
+            Optionally provide a preloaded site list, otherwise the site list
+            is loaded from file.
+        `capacity_error` : CapacityError
+            Optionally provide a preloaded CapacityError instance.
+        `parameters` : dict
+            Optionally fix the p1 parameter (the probability of each error
+            occurring) keyed by (error category, system type), instead of
+            drawing it from the capacity error config.
+        """
+        self.verbose = verbose
+        self.base = BaseSiteList() if base is None else base
+        self.ce = CapacityError() if capacity_error is None else capacity_error
+        self.rng = np.random.default_rng(seed)
+        self.parameters = {} if parameters is None else parameters
+        self.n_base = self.base.capacity.shape[0]
+        # base row index of each unreported site
+        self.source = np.empty(0, dtype=np.int64)
+        self.extra_indices = {"domestic": np.empty(0, dtype=np.int64),
+                              "non_domestic": np.empty(0, dtype=np.int64)}
+        # sparse record of the sites whose capacity has changed, sites are
+        # numbered by row with unreported sites following the base site list
+        self.changed_sites = np.empty(0, dtype=np.int64)
+        self.changed_capacity = np.empty(0)
+        # the capacity of every site of a system type, in the order of
+        # `type_sites`, once an error has affected all of them
+        self.dense = {"domestic": None, "non_domestic": None}
+        self._type_sites = {}
+        # sites with a missing capacity are skipped, as in the pandas sum
+        self.national_capacity = np.nansum(self.base.capacity,
+                                           dtype=np.float64)
+        # the change in capacity of each stage keyed by (stage, system type)
+        self.breakdown = {}
+
+    def unreported_systems(self):
+        """Augmenting the site list with unreported sites."""
+        counts = self.ce.config["unreported"]
+        band_indices = self.base.band_indices()
+        self.source = np.concatenate([
+            self.rng.choice(band_indices[band], int(counts[band]),
+                            replace=False)
+            for band in counts
+        ])
+        domestic = self.base.domestic[self.source]
+        self.extra_indices = {
+            "domestic": np.flatnonzero(domestic),
+            "non_domestic": np.flatnonzero(~domestic),
+        }
+        self._type_sites = {}
+        codes = self.base.system_type_code[self.source]
+        capacity = self.base.capacity[self.source]
+        for system_type, code in SYSTEM_TYPE_CODES.items():
+            self.breakdown[("unreported", system_type)] = \
+                np.nansum(capacity[codes == code], dtype=np.float64)
+        self.national_capacity += np.nansum(capacity, dtype=np.float64)
+
+    def simulate_effective_capacity_site_list(self):
+        """
+        Apply every error stage and return the national capacity.
+
+        Returns
+        -------
+        float
+            The national capacity of the simulated site list.
+        """
+        for error_category in ERROR_STAGES:
+            if self.verbose: print("{}...\n".format(error_category))
+            self.apply_error(error_category)
+            if self.verbose: print("\t--> done.")
+        return self.national_capacity
+
+    def type_sites(self, system_type):
+        """
+        Return the site numbers of every site of a system type, in order,
+        with the unreported sites following the base site list.
+        """
+        if system_type not in self._type_sites:
+            self._type_sites[system_type] = np.concatenate((
+                self.base.type_indices()[system_type],
+                self.n_base + self.extra_indices[system_type]
+            ))
+        return self._type_sites[system_type]
+
+    def sites_of_type(self, system_type, positions):
+        """
+        Convert positions within the sites of one system type to site numbers.
+
+        Parameters
+        ----------
+        `system_type` : string
+            Either "domestic" or "non_domestic".
+        `positions` : numpy.ndarray
+            Positions in [0, count of sites of `system_type`).
+        Returns
+        -------
+        numpy.ndarray
+            The site numbers.
+        """
+        return self.type_sites(system_type)[positions]
+
+    def current_capacity(self, sites):
+        """
+        Return the current capacity of each of the (sorted) `sites`, of
+        system types without a dense array.
+        """
+        in_base = sites < self.n_base
+        rows = np.where(in_base, sites, 0)
+        rows[~in_base] = self.source[sites[~in_base] - self.n_base]
+        capacity = self.base.capacity[rows]
+        if self.changed_sites.shape[0]:
+            pos = np.searchsorted(self.changed_sites, sites)
+            pos_clipped = np.minimum(pos, self.changed_sites.shape[0] - 1)
+            changed = self.changed_sites[pos_clipped] == sites
+            capacity[changed] = self.changed_capacity[pos_clipped[changed]]
+        return capacity
+
+    def type_capacity(self, system_type, positions=None):
+        """
+        Return the current capacity of the sites of a system type at the
+        (sorted) `positions`, or of all of them.
+        """
+        if self.dense[system_type] is not None:
+            if positions is None:
+                return self.dense[system_type].copy()
+            return self.dense[system_type][positions]
+        sites = self.type_sites(system_type)
+        return self.current_capacity(sites if positions is None
+                                     else sites[positions])
+
+    def set_dense(self, system_type, capacity, positions=None):
+        """
+        Record the new capacity of the sites of a system type at the
+        `positions`, or of all of them, in its dense array.
+
+        The first time a system type is stored densely its sparse changes
+        are dropped, as `capacity` already includes them.
+        """
+        if self.dense[system_type] is None:
+            sites = self.type_sites(system_type)
+            pos = np.searchsorted(sites, self.changed_sites)
+            pos_clipped = np.minimum(pos, sites.shape[0] - 1)
+            keep = sites[pos_clipped] != self.changed_sites
+            self.changed_sites = self.changed_sites[keep]
+            self.changed_capacity = self.changed_capacity[keep]
+            self.dense[system_type] = capacity
+        elif positions is None:
+            self.dense[system_type] = capacity
+        else:
+            self.dense[system_type][positions] = capacity
+
+    def update_capacity(self, sites, capacity):
+        """
+        Record the new capacity of each of the `sites`, merging them into
+        the sorted sparse record in one pass.
+        """
+        pos = np.searchsorted(self.changed_sites, sites)
+        if self.changed_sites.shape[0]:
+            pos_clipped = np.minimum(pos, self.changed_sites.shape[0] - 1)
+            changed = self.changed_sites[pos_clipped] == sites
+        else:
+            pos_clipped = pos
+            changed = np.zeros(sites.shape[0], dtype=bool)
+        self.changed_capacity[pos_clipped[changed]] = capacity[changed]
+        all_sites = np.concatenate((self.changed_sites, sites[~changed]))
+        order = np.argsort(all_sites, kind="stable")
+        self.changed_sites = all_sites[order]
+        self.changed_capacity = np.concatenate(
+            (self.changed_capacity, capacity[~changed])
+        )[order]
+
+    def site_capacities(self):
+        """
+        Return the capacity of every site in the simulated site list.
+
+        Returns
+        -------
+        tuple
+            The base row of every site, with the unreported sites following
+            the base site list, and the capacity of every site.
+        """
+        rows = np.concatenate((np.arange(self.n_base), self.source))
+        capacity = self.base.capacity[rows].astype(np.float64)
+        capacity[self.changed_sites] = self.changed_capacity
+        for system_type, dense in self.dense.items():
+            if dense is not None:
+                capacity[self.type_sites(system_type)] = dense
+        return rows, capacity
+
+    def apply_error(self, error_category):
+        pdf = self.ce.error_pdf
+        updates = []
+        for system_type in ["domestic", "non_domestic"]:
+            n_type = self.base.type_indices()[system_type].shape[0] + \
+                self.extra_indices[system_type].shape[0]
+            if (error_category, system_type) in self.parameters:
+                probability_error_occurs = \
+                    self.parameters[(error_category, system_type)]
+            else:
+                probability_error_occurs = pdf(system_type, order="p1",
+                                               _error=error_category, size=1,
+                                               random_state=self.rng)[0]
+            count = self.rng.binomial(
+                n_type, min(max(probability_error_occurs, 0), 1)
+            )
+            self.breakdown[(error_category, system_type)] = 0.
+            if count == 0:
+                continue
+            # every site is affected, so none need sampling
+            positions = None if count == n_type else \
+                np.sort(self.rng.choice(n_type, count, replace=False))
+            capacity = self.type_capacity(system_type, positions)
+            if error_category == "site_uncertainty" and system_type == "domestic":
+                effect_of_error = pdf(system_type, order="p2",
+                                      _error=error_category, size=count,
+                                      bounds=(0, 1), random_state=self.rng)
+                new_capacity = capacity + effect_of_error
+            else:
+                effect_of_error = pdf(system_type, order="p2",
+                                      _error=error_category, size=count,
+                                      random_state=self.rng) + 1
+                new_capacity = capacity * effect_of_error
+            if (new_capacity < 0).any():
+                raise Exception("Negative capacity values following error: {}"
+                                .format(error_category))
+            change = np.nansum(new_capacity - capacity, dtype=np.float64)
+            self.breakdown[(error_category, system_type)] = change
+            self.national_capacity += change
+            if positions is None or self.dense[system_type] is not None:
+                self.set_dense(system_type, new_capacity, positions)
+            else:
+                updates.append((self.sites_of_type(system_type, positions),
+                                new_capacity))
+        if updates:
+            self.update_capacity(np.concatenate([u[0] for u in updates]),
+                                 np.concatenate([u[1] for u in updates]))
+
+
+if __name__ == "__main__":
+    self = NationalCapacityVariation(1, verbose=True)
+    self.unreported_systems()
+    print(self.simulate_effective_capacity_site_list())
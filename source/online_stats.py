@@ -0,0 +1,246 @@
+"""
+Streaming statistics of the national capacity, updated as each Monte Carlo
+simulation finishes, and a convergence test to stop the run early.
+
+- The mean and variance use Welford's algorithm.
+- The quantiles use the P-squared algorithm (Jain & Chlamtac 1985, "The P2
+  algorithm for dynamic calculation of quantiles and histograms without
+  storing observations"), which keeps five markers per quantile.
+"""
+
+import math
+import numpy as np
+from scipy.stats import norm
+
+
+class P2Quantile:
+    """A streaming estimate of a single quantile."""
+
+    def __init__(self, p):
+        """
+        Parameters
+        ----------
+        `p` : float
+            The quantile to estimate, in (0, 1).
+        """
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        """Add an observation."""
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(x)
+            self.heights.sort()
+            return
+        q = self.heights
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or \
+                    (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def parabolic(self, i, d):
+        """The piecewise-parabolic prediction of the height of marker i."""
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def value(self):
+        """The current estimate of the quantile."""
+        if self.count == 0:
+            return np.nan
+        if self.count <= 5:
+            return float(np.quantile(self.heights, self.p))
+        return self.heights[2]
+
+    def density(self):
+        """
+        Estimate the probability density at the quantile from the spacing
+        between its marker and the neighbouring marker on the tail side,
+        i.e. over [p/2, p] for p < 0.5 or [p, (1 + p)/2] otherwise.
+        """
+        if self.count <= 5:
+            return np.nan
+        lower, upper = (1, 2) if self.p < 0.5 else (2, 3)
+        spread = self.heights[upper] - self.heights[lower]
+        if spread <= 0:
+            return np.inf
+        return (self.positions[upper] - self.positions[lower]) / \
+            (self.count * spread)
+
+
+class RunningStatistics:
+    """
+    The running mean, variance and quantiles of the national capacity.
+    """
+
+    def __init__(self, quantiles=(0.01, 0.99), min_tail_count=10):
+        """
+        Parameters
+        ----------
+        `quantiles` : tuple
+            The quantiles to estimate.
+        `min_tail_count` : int
+            The number of results expected beyond a quantile before its
+            confidence interval is estimated, i.e. n * min(p, 1 - p).
+        """
+        self.count = 0
+        self.min_tail_count = min_tail_count
+        self.mean = 0.
+        self._m2 = 0.
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def update(self, x):
+        """Add the result of a simulation."""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        for estimator in self.quantiles.values():
+            estimator.update(x)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count > 1 else np.nan
+
+    def mean_half_width(self, confidence=0.95):
+        """The half width of the confidence interval on the mean."""
+        if self.count < 2:
+            return np.inf
+        z = norm.ppf((1 + confidence) / 2)
+        return z * self.std / math.sqrt(self.count)
+
+    def quantile_half_width(self, p, confidence=0.95):
+        """
+        The half width of the confidence interval on quantile `p`, from the
+        asymptotic standard error sqrt(p (1 - p) / n) / f(x_p).
+        """
+        if self.count * min(p, 1 - p) < self.min_tail_count:
+            return np.inf
+        density = self.quantiles[p].density()
+        if not density > 0:
+            return np.inf
+        z = norm.ppf((1 + confidence) / 2)
+        return z * math.sqrt(p * (1 - p) / self.count) / density
+
+    def converged(self, tolerance, confidence=0.95, min_count=100):
+        """
+        Test whether the confidence intervals on the mean and on every
+        quantile are narrower than the tolerance.
+
+        Parameters
+        ----------
+        `tolerance` : float
+            The largest acceptable half width, in the units of the results.
+        `confidence` : float
+            The confidence level of the intervals.
+        `min_count` : int
+            The minimum number of results before the test can pass.
+        Returns
+        -------
+        bool
+        """
+        if self.count < min_count:
+            return False
+        if self.mean_half_width(confidence) > tolerance:
+            return False
+        return all(self.quantile_half_width(p, confidence) <= tolerance
+                   for p in self.quantiles)
+
+    def summary(self, confidence=0.95):
+        """
+        Return the current estimates.
+
+        Returns
+        -------
+        dict
+            The count, mean, standard deviation and quantiles, with the half
+            widths of their confidence intervals.
+        """
+        summary = {"count": self.count, "mean": self.mean, "std": self.std,
+                   "mean_half_width": self.mean_half_width(confidence)}
+        for p, estimator in self.quantiles.items():
+            summary["q{}".format(p)] = estimator.value
+            summary["q{}_half_width".format(p)] = \
+                self.quantile_half_width(p, confidence)
+        return summary
+
+
+def weighted_quantile_index(values, weights, q):
+    """
+    Return the index of the result at quantile `q` of weighted results,
+    i.e. the smallest result whose normalised cumulative weight is >= q.
+
+    Parameters
+    ----------
+    `values` : numpy.ndarray
+        The results.
+    `weights` : numpy.ndarray
+        The likelihood ratio weight of each result.
+    `q` : float
+        The quantile, in (0, 1).
+    Returns
+    -------
+    int
+    """
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(values, kind="stable")
+    cumulative = np.cumsum(np.asarray(weights, dtype=float)[order])
+    position = np.searchsorted(cumulative, q * cumulative[-1])
+    return int(order[min(position, order.shape[0] - 1)])
+
+
+def weighted_summary(values, weights, quantiles=(0.01, 0.99)):
+    """
+    Return the self-normalised importance sampling estimates of weighted
+    results.
+
+    Returns
+    -------
+    dict
+        The count, the effective sample size (sum w)^2 / sum w^2, the mean,
+        the standard deviation and the quantiles.
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+    mean = (weights * values).sum() / total
+    summary = {"count": values.shape[0],
+               "effective_count": total ** 2 / (weights ** 2).sum(),
+               "mean": mean,
+               "std": math.sqrt((weights * (values - mean) ** 2).sum() / total)}
+    for p in quantiles:
+        summary["q{}".format(p)] = \
+            values[weighted_quantile_index(values, weights, p)]
+    return summary
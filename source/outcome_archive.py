@@ -0,0 +1,240 @@
+"""
+An archive of the per-site capacities of many site list simulations.
+
+Each simulation is stored as the sites whose capacity differs from a
+reference, with their capacities, which is compact because most of the
+error categories change few sites. The reference is regenerated from the
+seed with the engine of the run: the unreported sites and the dense stages
+(by default "site_uncertainty", which changes almost every domestic site)
+are replayed instead of stored. With the keyed random streams only the
+dense stages are replayed, as the keyed outcome of a site does not depend
+on the other stages. The other engines draw from one sequential stream, so
+every stage up to the last dense stage is replayed.
+
+Each simulation is saved as an .npz file named by its seed, with the sorted
+positions of the changed sites delta encoded as the gaps between them, in
+the smallest unsigned integer type that holds the largest gap.
+"""
+
+import os
+import json
+import numpy as np
+from site_list_variation import ERROR_STAGES
+from site_list_monte_carlo_simuation import simulation_engine
+
+# the options of a run that select the engine of its simulations
+ENGINE_OPTIONS = ("keyed_streams", "sparse", "batch", "national_total")
+
+
+def encode_positions(positions):
+    """Delta encode sorted site positions."""
+    gaps = np.diff(positions, prepend=0)
+    largest = int(gaps.max()) if gaps.shape[0] else 0
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if largest <= np.iinfo(dtype).max:
+            return gaps.astype(dtype)
+
+
+def decode_positions(gaps):
+    """Decode site positions from `encode_positions`."""
+    return np.cumsum(gaps, dtype=np.int64)
+
+
+def engine_options(options=None):
+    """
+    Return the engine options of a run, e.g. from its manifest, with every
+    option of ENGINE_OPTIONS, by default the global numpy random state.
+    """
+    options = {} if options is None else options
+    return {option: bool(options.get(option, False))
+            for option in ENGINE_OPTIONS}
+
+
+class OutcomeArchive:
+    """
+    Saving and rebuilding the per-site capacities of simulations.
+    """
+
+    def __init__(self, directory, base, capacity_error,
+                 dense_stages=("site_uncertainty",)):
+        """
+        Parameters
+        ----------
+        `directory` : string
+            The directory of the archive, created on the first `add`.
+        `base` : BaseSiteList
+            The site list the simulations were made with.
+        `capacity_error` : CapacityError
+            The capacity error config the simulations were made with.
+        `dense_stages` : tuple
+            The error categories regenerated from the seed rather than
+            stored. Ignored if the archive already exists.
+        """
+        self.directory = directory
+        self.base = base
+        self.ce = capacity_error
+        self.dense_stages = tuple(stage for stage in ERROR_STAGES
+                                  if stage in dense_stages)
+        metadata = self.read_metadata()
+        if metadata is not None:
+            if metadata["site_list"] != base.checksum() or \
+                    metadata["capacity_error"] != capacity_error.checksum():
+                raise ValueError("The site list or capacity error config "
+                                 "differs from the one the archive was "
+                                 "made with.")
+            self.dense_stages = tuple(metadata["dense_stages"])
+
+    def read_metadata(self):
+        file = os.path.join(self.directory, "archive.json")
+        if not os.path.isfile(file):
+            return None
+        with open(file) as fid:
+            return json.load(fid)
+
+    def file(self, seed):
+        return os.path.join(self.directory, "sim-{}.npz".format(int(seed)))
+
+    def __contains__(self, seed):
+        return os.path.isfile(self.file(seed))
+
+    def seeds(self):
+        """Return the seeds of the archived simulations."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[4:-4]) for name in os.listdir(self.directory)
+                      if name.startswith("sim-") and name.endswith(".npz"))
+
+    def reference(self, seed, options, parameters, sites=None):
+        """
+        Return the base rows and reference capacities of the simulated sites.
+
+        Parameters
+        ----------
+        `seed` : int
+            The seed of the simulation.
+        `options` : dict
+            The engine options of the simulation, see `engine_options`.
+        `parameters` : dict
+            The p1 parameters fixed for the simulation.
+        `sites` : numpy.ndarray
+            Optionally the positions of the sites to return.
+        Returns
+        -------
+        tuple
+            The base row and the reference capacity of each site.
+        """
+        options = engine_options(options)
+        sl_rvs = simulation_engine(seed, options, self.base, self.ce,
+                                   parameters=parameters)
+        sl_rvs.unreported_systems()
+        if options["keyed_streams"] and not (options["batch"] or
+                                             options["national_total"]):
+            if sites is not None:
+                sl_rvs.select_sites(sites)
+            for stage in self.dense_stages:
+                sl_rvs.apply_keyed_error(stage)
+            return sl_rvs.rows, sl_rvs.capacity
+        if self.dense_stages:
+            last = max(ERROR_STAGES.index(stage)
+                       for stage in self.dense_stages)
+            for stage in ERROR_STAGES[:last + 1]:
+                sl_rvs.apply_error(stage)
+        rows, capacity = sl_rvs.site_capacities()
+        if sites is not None:
+            rows, capacity = rows[sites], capacity[sites]
+        return rows, capacity.astype(np.float64)
+
+    def add(self, seed, rows, capacity, options=None, parameters=None):
+        """
+        Archive the per-site capacities of a simulation.
+
+        Parameters
+        ----------
+        `seed` : int
+            The seed of the simulation.
+        `rows` : numpy.ndarray
+            The base row of every site, with the unreported sites following
+            the base site list.
+        `capacity` : numpy.ndarray
+            The capacity of every site.
+        `options` : dict
+            The engine options of the simulation, see `engine_options`, by
+            default the global numpy random state.
+        `parameters` : dict
+            The p1 parameters fixed for the simulation, if any.
+        """
+        options = engine_options(options)
+        parameters = {} if parameters is None else parameters
+        reference_rows, reference = self.reference(seed, options, parameters)
+        if not np.array_equal(reference_rows, rows):
+            raise ValueError("The sites of simulation {} differ from the ones "
+                             "its seed and engine options give."
+                             .format(seed))
+        changed = np.flatnonzero(
+            ~((capacity == reference) |
+              (np.isnan(capacity) & np.isnan(reference)))
+        )
+        if self.read_metadata() is None:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, "archive.json"), "w") \
+                    as fid:
+                json.dump({"site_list": self.base.checksum(),
+                           "capacity_error": self.ce.checksum(),
+                           "dense_stages": self.dense_stages}, fid)
+        np.savez(self.file(seed), n_sites=len(rows),
+                 options=np.array(json.dumps(options)),
+                 parameter_keys=np.array(["|".join(key)
+                                          for key in parameters], dtype=str),
+                 parameter_values=np.array(list(parameters.values()),
+                                           dtype=np.float64),
+                 positions=encode_positions(changed),
+                 values=np.asarray(capacity, dtype=np.float64)[changed])
+
+    def add_variation(self, sl_rvs):
+        """Archive a SiteListVariation after its simulation."""
+        self.add(sl_rvs.seed, sl_rvs.rows, sl_rvs.capacity,
+                 options={"keyed_streams": sl_rvs.streams is not None,
+                          "sparse": sl_rvs.rng is not None},
+                 parameters=sl_rvs.parameters)
+
+    def decode(self, seed, sites=None):
+        """
+        Rebuild the per-site capacities of an archived simulation.
+
+        Parameters
+        ----------
+        `seed` : int
+            The seed of the simulation.
+        `sites` : numpy.ndarray
+            Optionally the positions of the sites to rebuild, otherwise
+            every site is rebuilt.
+        Returns
+        -------
+        tuple
+            The base row and the capacity of each site.
+        """
+        with np.load(self.file(seed)) as data:
+            entry = {key: data[key] for key in data.files}
+        parameters = {tuple(key.split("|")): float(value)
+                      for key, value in zip(entry["parameter_keys"],
+                                            entry["parameter_values"])}
+        if sites is not None:
+            sites = np.asarray(sites, dtype=np.int64)
+        rows, capacity = self.reference(seed,
+                                        json.loads(str(entry["options"])),
+                                        parameters, sites=sites)
+        positions = decode_positions(entry["positions"])
+        values = entry["values"]
+        if sites is None:
+            capacity[positions] = values
+        elif positions.shape[0]:
+            pos = np.searchsorted(positions, sites)
+            pos_clipped = np.minimum(pos, positions.shape[0] - 1)
+            changed = positions[pos_clipped] == sites
+            capacity[changed] = values[pos_clipped[changed]]
+        return rows, capacity
+
+    def site_list(self, seed, sites=None):
+        """Rebuild the site list of an archived simulation as a DataFrame."""
+        rows, capacity = self.decode(seed, sites)
+        return self.base.frame(capacity, rows)
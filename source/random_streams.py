@@ -0,0 +1,157 @@
+"""
+Counter-based random numbers for the site list simulations.
+
+Every random number is computed directly from a key and a counter with the
+Philox4x32-10 generator (Salmon et al. 2011, "Parallel random numbers: as
+easy as 1, 2, 3"), rather than taken from a sequential stream. The key is
+the simulation seed and the counter is made from the site id and the name
+of the error category, so the draws for a site do not depend on which
+other sites are simulated, in what order, or on which worker.
+"""
+
+import zlib
+import numpy as np
+
+_M0 = np.uint64(0xD2511F53)
+_M1 = np.uint64(0xCD9E8D57)
+_W0 = 0x9E3779B9
+_W1 = 0xBB67AE85
+_MASK = np.uint64(0xFFFFFFFF)
+_SHIFT = np.uint64(32)
+
+# the kinds of draw, used as the last word of the counter
+SITE = 0
+PARAMETER = 1
+SAMPLE = 2
+
+SYSTEM_TYPE_CODES = {"domestic": 0, "non_domestic": 1}
+
+# the ids of unreported sites are the id of the site they duplicate offset
+# by this, so they never share a key with a site of the site list
+UNREPORTED_ID = 2 ** 62
+
+
+def philox4x32(counter, key, rounds=10):
+    """
+    The Philox4x32 block cipher, vectorised over the counters.
+
+    Parameters
+    ----------
+    `counter` : tuple
+        Four arrays (or scalars) of 32 bit counter words.
+    `key` : tuple
+        Two 32 bit key words.
+    `rounds` : int
+        The number of rounds, 10 is the standard Philox4x32-10.
+    Returns
+    -------
+    tuple
+        Four uint64 arrays, each holding 32 bits of random output.
+    """
+    c0, c1, c2, c3 = [np.asarray(c, dtype=np.uint64) for c in counter]
+    k0, k1 = [int(k) & 0xFFFFFFFF for k in key]
+    for _ in range(rounds):
+        p0 = _M0 * c0
+        p1 = _M1 * c2
+        c0, c1, c2, c3 = ((p1 >> _SHIFT) ^ c1 ^ np.uint64(k0), p1 & _MASK,
+                          (p0 >> _SHIFT) ^ c3 ^ np.uint64(k1), p0 & _MASK)
+        k0 = (k0 + _W0) & 0xFFFFFFFF
+        k1 = (k1 + _W1) & 0xFFFFFFFF
+    return c0, c1, c2, c3
+
+
+def stream_id(name):
+    """Return a stable 32 bit id for a named stream, e.g. an error category."""
+    return zlib.crc32(name.encode("utf-8"))
+
+
+def to_uniform(high, low):
+    """Combine two 32 bit words into a double in [0, 1) with 53 random bits."""
+    bits = ((high << _SHIFT) | low) >> np.uint64(11)
+    return bits.astype(np.float64) * 2.0 ** -53
+
+
+class RandomStreams:
+    """
+    Random numbers keyed by (simulation seed, site id, stream name).
+    """
+
+    def __init__(self, seed):
+        """
+        Parameters
+        ----------
+        `seed` : int
+            The simulation seed, up to 64 bits.
+        """
+        self.seed = int(seed)
+        self.key = (self.seed & 0xFFFFFFFF, (self.seed >> 32) & 0xFFFFFFFF)
+
+    def uniforms(self, name, ids, kind=SITE):
+        """
+        Return two independent uniform random numbers for each id.
+
+        Parameters
+        ----------
+        `name` : string
+            The name of the stream, e.g. the error category.
+        `ids` : numpy.ndarray
+            Non-negative integer ids, e.g. site ids.
+        `kind` : int
+            The kind of draw, one of SITE, PARAMETER or SAMPLE.
+        Returns
+        -------
+        tuple
+            Two float64 arrays of uniform random numbers in [0, 1).
+        """
+        ids = np.asarray(ids, dtype=np.uint64)
+        o0, o1, o2, o3 = philox4x32(
+            (ids & _MASK, ids >> _SHIFT, stream_id(name), kind), self.key
+        )
+        return to_uniform(o0, o1), to_uniform(o2, o3)
+
+    def site_uniforms(self, error_category, site_ids):
+        """
+        Return the uniform random numbers that decide whether an error occurs
+        at each site, and the size of its effect.
+        """
+        return self.uniforms(error_category, site_ids, kind=SITE)
+
+    def parameter_uniform(self, error_category, system_type):
+        """Return the uniform random number for a per-simulation parameter."""
+        u, _ = self.uniforms(error_category,
+                             [SYSTEM_TYPE_CODES[system_type]], kind=PARAMETER)
+        return u[0]
+
+    def sample(self, name, population, count, ids=None):
+        """
+        Sample `count` members of `population` without replacement.
+
+        Each member is given a uniform random number keyed by its id and
+        the `count` smallest are taken, so the sample only depends on the
+        ids of the members of the population, not their order.
+
+        Parameters
+        ----------
+        `name` : string
+            The name of the stream.
+        `population` : numpy.ndarray
+            The members to sample from.
+        `count` : int
+            The size of the sample.
+        `ids` : numpy.ndarray
+            Optionally the unique id of each member, by default the members
+            are their own ids.
+        Returns
+        -------
+        numpy.ndarray
+            The sampled members, sorted by id.
+        """
+        population = np.asarray(population)
+        ids = population if ids is None else np.asarray(ids)
+        if count >= population.shape[0]:
+            if count > population.shape[0]:
+                raise ValueError("Cannot take a larger sample than population")
+            return population[np.argsort(ids, kind="stable")]
+        u, _ = self.uniforms(name, ids, kind=SAMPLE)
+        chosen = np.argpartition(u, count)[:count]
+        return population[chosen[np.argsort(ids[chosen], kind="stable")]]
@@ -0,0 +1,239 @@
+"""
+An append-only columnar store of the Monte Carlo results.
+
+Each batch of results is written as a chunk, a .npy file of a numpy
+structured array holding the seed, the national capacity, the likelihood
+ratio weight of the simulation (1 unless the run used importance sampling)
+and the capacity added (+) or removed (-) by each error stage for each
+system type. Chunks
+are written to a temporary file and renamed into place, so an interrupted
+run leaves only whole chunks behind.
+"""
+
+import os
+import glob
+import json
+import time
+import queue
+import threading
+import numpy as np
+import pandas as pd
+from random_streams import SYSTEM_TYPE_CODES
+from site_list_variation import ERROR_STAGES
+
+# the stages whose change in capacity is recorded, unreported sites first
+BREAKDOWN_STAGES = ("unreported",) + ERROR_STAGES
+
+
+def breakdown_column(stage, system_type):
+    """Return the store column of the change in capacity of a stage."""
+    return "{}_{}_MW".format(stage, system_type)
+
+
+BREAKDOWN_COLUMNS = tuple(breakdown_column(stage, system_type)
+                          for stage in BREAKDOWN_STAGES
+                          for system_type in SYSTEM_TYPE_CODES)
+
+RESULTS_DTYPE = np.dtype(
+    [("random_seed", np.int64), ("national_capacity_MW", np.float64),
+     ("weight", np.float64)]
+    + [(column, np.float64) for column in BREAKDOWN_COLUMNS]
+)
+
+
+class ResultsStore:
+    """
+    The results of a Monte Carlo run, stored as chunks in a directory.
+    """
+
+    def __init__(self, directory):
+        """
+        Parameters
+        ----------
+        `directory` : string
+            The directory of the store, created on the first append.
+        """
+        self.directory = directory
+
+    def chunks(self):
+        """Return the chunk files of the store, in the order written."""
+        return sorted(glob.glob(os.path.join(self.directory, "part-*.npy")))
+
+    def exists(self):
+        """Test whether any results have been written to the store."""
+        return len(self.chunks()) > 0
+
+    def read_manifest(self):
+        """
+        Return the manifest of the run that wrote the store, or None if it
+        has none.
+        """
+        file = os.path.join(self.directory, "manifest.json")
+        if not os.path.isfile(file):
+            return None
+        with open(file) as fid:
+            return json.load(fid)
+
+    def write_manifest(self, manifest):
+        """
+        Save the manifest of the run, which identifies the site list, the
+        capacity error config, the options and the seeds that produce the
+        results, so that an interrupted run can be resumed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file = os.path.join(self.directory, "manifest.json")
+        with open(file + ".tmp", "w") as fid:
+            json.dump(manifest, fid)
+        os.replace(file + ".tmp", file)
+
+    def append(self, seeds, capacities, breakdowns=None, weights=None):
+        """
+        Write a chunk of results.
+
+        Parameters
+        ----------
+        `seeds` : list
+            The seed of each simulation.
+        `capacities` : list
+            The national capacity of each simulation.
+        `breakdowns` : list
+            Optionally the change in capacity of each simulation as a dict
+            keyed by (stage, system type), stages not given are stored as
+            NaN.
+        `weights` : list
+            Optionally the likelihood ratio weight of each simulation,
+            otherwise 1.
+        """
+        chunk = np.zeros(len(seeds), dtype=RESULTS_DTYPE)
+        for column in BREAKDOWN_COLUMNS:
+            chunk[column] = np.nan
+        chunk["random_seed"] = seeds
+        chunk["national_capacity_MW"] = capacities
+        chunk["weight"] = 1. if weights is None else weights
+        for i, breakdown in enumerate(breakdowns or []):
+            for (stage, system_type), change in breakdown.items():
+                chunk[breakdown_column(stage, system_type)][i] = change
+        os.makedirs(self.directory, exist_ok=True)
+        file = os.path.join(self.directory,
+                            "part-{:06d}.npy".format(len(self.chunks())))
+        tmp_file = file + ".tmp"
+        with open(tmp_file, "wb") as fid:
+            np.save(fid, chunk)
+        os.replace(tmp_file, file)
+
+    def read(self):
+        """Return every result as a single structured array."""
+        chunks = [np.load(file) for file in self.chunks()]
+        if not chunks:
+            return np.empty(0, dtype=RESULTS_DTYPE)
+        return np.concatenate(chunks)
+
+    def load(self):
+        """Return every result as a DataFrame."""
+        return pd.DataFrame(self.read())
+
+
+def load_results(path):
+    """
+    Load Monte Carlo results, either from a ResultsStore directory or from a
+    csv file written before the store, whose columns are renamed to match.
+
+    Parameters
+    ----------
+    `path` : string
+        The store directory or csv file.
+    Returns
+    -------
+    pd.DataFrame
+        The results, with at least the "random_seed" and
+        "national_capacity_MW" columns.
+    """
+    if os.path.isdir(path):
+        return ResultsStore(path).load()
+    data = pd.read_csv(path)
+    data.rename({" national_capacity (MW)": "national_capacity_MW"},
+                inplace=True, axis=1)
+    return data
+
+
+class ResultsWriter:
+    """
+    Write results to a ResultsStore from a background thread, so that the
+    simulations do not wait on the disk.
+
+    Results are passed to the thread through a bounded queue and written as
+    a chunk once `chunk_size` results are waiting or `interval` seconds have
+    passed since the last chunk. Closing the writer, including on an
+    exception, writes every result that has been queued.
+    """
+
+    def __init__(self, store, chunk_size=10, interval=60., max_queue=1000):
+        """
+        Parameters
+        ----------
+        `store` : ResultsStore
+            The store to write to.
+        `chunk_size` : int
+            The number of results in each chunk.
+        `interval` : float
+            The longest time (s) a result waits before it is written.
+        `max_queue` : int
+            The number of results that can wait in the queue, beyond which
+            `put` blocks until the thread catches up.
+        """
+        self.store = store
+        self.chunk_size = max(1, int(chunk_size))
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.error = None
+        self.thread = threading.Thread(target=self.write_chunks, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, seed, capacity, breakdown=None, weight=1.):
+        """Queue the result of a simulation to be written."""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((seed, capacity, breakdown, weight))
+
+    def close(self):
+        """Write every queued result and stop the thread."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def write_chunks(self):
+        """Collect results from the queue and write them in chunks."""
+        pending = []
+        last_write = time.monotonic()
+        while True:
+            wait = last_write + self.interval - time.monotonic()
+            try:
+                item = self.queue.get(timeout=max(0., wait))
+            except queue.Empty:
+                item = ()
+            if item:
+                pending.append(item)
+            due = time.monotonic() - last_write >= self.interval
+            if pending and (item is None or due or
+                            len(pending) >= self.chunk_size):
+                # after a failed write keep emptying the queue, so that put
+                # and close do not block, the error is raised by either
+                if self.error is None:
+                    try:
+                        self.store.append(*map(list, zip(*pending)))
+                    except Exception as error:
+                        self.error = error
+                pending = []
+                last_write = time.monotonic()
+            elif due:
+                last_write = time.monotonic()
+            if item is None:
+                return
@@ -0,0 +1,272 @@
+"""
+Variance reduction designs for the per-simulation error probabilities
+("p1") of the capacity error config.
+
+Instead of drawing the p1 parameters of each simulation independently, a
+design of uniform random numbers is built for the whole run and mapped
+through the inverse cdfs of the config. The designs are split into
+independent blocks (antithetic pairs, or randomised Latin hypercube / Sobol
+replicates) so that the variance of the estimated mean can be measured and
+compared with plain Monte Carlo.
+
+The "importance" design instead targets the tails of the national
+capacity. The normal scores z = ndtri(u) of the p1 parameters are drawn
+from a defensive mixture of N(0, I) and of normals shifted by +/- mu, where
+mu points in the direction that moves the national capacity the most, and
+every simulation is given the likelihood ratio weight of N(0, I) against
+the mixture so that weighted estimates are unbiased.
+"""
+
+import math
+import numpy as np
+from scipy.stats import qmc
+from scipy.special import ndtr
+from capacity_error import ADDITIVE_ERRORS
+
+SAMPLING_METHODS = ("random", "antithetic", "latin_hypercube", "sobol",
+                    "importance")
+
+# the mixture probabilities of the importance design's components, shifted
+# by -mu (the lower tail), not shifted and shifted by +mu (the upper tail)
+IMPORTANCE_MIXTURE = (0.25, 0.5, 0.25)
+
+
+def p1_dimensions(config):
+    """
+    Return the (error category, system type) pairs with a random p1.
+
+    Parameters
+    ----------
+    `config` : dict
+        The capacity error config.
+    Returns
+    -------
+    list
+        The pairs, sorted, whose p1 is not a constant.
+    """
+    return sorted((error, system_type)
+                  for error, entry in config.items() if error != "unreported"
+                  for system_type, orders in entry.items()
+                  if orders["p1"][0] != "uniform")
+
+
+def block_size(method, N, replicates=10):
+    """
+    Return the number of simulations in each independent block.
+
+    Sobol blocks are rounded up to a power of 2, which keeps the balance
+    properties of the points, so there may be fewer than `replicates`.
+    """
+    if method in ("random", "importance"):
+        return 1
+    if method == "antithetic":
+        return 2
+    size = max(1, math.ceil(N / replicates))
+    if method == "sobol":
+        return 2 ** math.ceil(math.log2(size))
+    return size
+
+
+def uniform_design(method, N, d, seed=None, replicates=10):
+    """
+    Build a design of uniform random numbers.
+
+    Parameters
+    ----------
+    `method` : string
+        One of "random", "antithetic", "latin_hypercube" or "sobol".
+    `N` : int
+        The number of simulations.
+    `d` : int
+        The number of parameters.
+    `seed` : int
+        The seed of the design.
+    `replicates` : int
+        The number of independent randomised Latin hypercube or Sobol
+        blocks, ignored by the other methods. The last block is trimmed to
+        give N simulations, see `block_size`.
+    Returns
+    -------
+    numpy.ndarray
+        An (N, d) array of uniform random numbers in (0, 1).
+    """
+    rng = np.random.default_rng(seed)
+    if method == "random":
+        design = rng.random((N, d))
+    elif method == "antithetic":
+        u = rng.random((math.ceil(N / 2), d))
+        design = np.empty((2 * u.shape[0], d))
+        design[0::2] = u
+        design[1::2] = 1 - u
+    elif method in ("latin_hypercube", "sobol"):
+        size = block_size(method, N, replicates)
+        blocks = []
+        for _ in range(math.ceil(N / size)):
+            if method == "sobol":
+                engine = qmc.Sobol(d, scramble=True, seed=rng)
+                blocks.append(engine.random_base2(int(math.log2(size))))
+            else:
+                engine = qmc.LatinHypercube(d, seed=rng)
+                blocks.append(engine.random(size))
+        design = np.concatenate(blocks)
+    else:
+        raise ValueError("Unknown sampling method {}, expected one of {}"
+                         .format(method, SAMPLING_METHODS))
+    # keep clear of 0 and 1 for the inverse cdfs
+    return np.clip(design[:N], 1e-12, 1 - 1e-12)
+
+
+def importance_directions(capacity_error, capacities, counts):
+    """
+    Return the unit direction, in the normal scores of the p1 parameters,
+    in which the national capacity increases fastest.
+
+    The rate of change for each parameter is estimated as the change in p1
+    across the middle of its distribution, times the mean effect of the
+    error on the capacity (or, for additive errors, on the number) of the
+    sites of its system type.
+
+    Parameters
+    ----------
+    `capacity_error` : CapacityError
+        The capacity error config.
+    `capacities` : dict
+        The total capacity of the sites of each system type.
+    `counts` : dict
+        The number of sites of each system type.
+    Returns
+    -------
+    list
+        The direction, with one entry per `p1_dimensions`.
+    """
+    u = (np.arange(1000) + 0.5) / 1000
+    gradient = []
+    for error, system_type in p1_dimensions(capacity_error.config):
+        p1 = capacity_error.error_ppf(system_type, ndtr(np.array([-.5, .5])),
+                                      order="p1", _error=error)
+        if (error, system_type) in ADDITIVE_ERRORS:
+            effect = capacity_error.error_ppf(
+                system_type, u, order="p2", _error=error,
+                bounds=ADDITIVE_ERRORS[(error, system_type)]
+            ).mean()
+            scale = counts[system_type]
+        else:
+            effect = capacity_error.error_ppf(system_type, u, order="p2",
+                                              _error=error).mean()
+            scale = capacities[system_type]
+        gradient.append((p1[1] - p1[0]) * effect * scale)
+    gradient = np.array(gradient)
+    norm = np.sqrt((gradient ** 2).sum())
+    return (gradient / norm if norm > 0 else gradient).tolist()
+
+
+def importance_design(N, directions, tilt=1.5, seed=None):
+    """
+    Build the importance design of uniform random numbers and its weights.
+
+    Parameters
+    ----------
+    `N` : int
+        The number of simulations.
+    `directions` : list
+        The unit direction of the shift, see `importance_directions`.
+    `tilt` : float
+        The size of the shift, in standard deviations of the normal scores.
+    `seed` : int
+        The seed of the design.
+    Returns
+    -------
+    tuple
+        An (N, d) array of uniform random numbers in (0, 1), and the N
+        likelihood ratio weights, which have expectation 1.
+    """
+    rng = np.random.default_rng(seed)
+    mu = tilt * np.asarray(directions, dtype=float)
+    shifts = np.array([-1., 0., 1.])
+    component = rng.choice(3, size=N, p=IMPORTANCE_MIXTURE)
+    z = rng.standard_normal((N, mu.shape[0])) + \
+        shifts[component, np.newaxis] * mu
+    # the mixture density relative to N(0, I) at z, by component
+    log_ratios = shifts[np.newaxis, :] * (z @ mu)[:, np.newaxis] \
+        - shifts[np.newaxis, :] ** 2 * (mu @ mu) / 2
+    weights = 1 / (np.exp(log_ratios) * np.array(IMPORTANCE_MIXTURE)).sum(axis=1)
+    return np.clip(ndtr(z), 1e-12, 1 - 1e-12), weights
+
+
+def p1_parameters(capacity_error, N, method="random", seed=None,
+                  replicates=10, directions=None, tilt=1.5):
+    """
+    Draw the p1 parameters of every simulation from a design.
+
+    Parameters
+    ----------
+    `capacity_error` : CapacityError
+        The capacity error config.
+    `N` : int
+        The number of simulations.
+    `method` : string
+        The sampling method, see `uniform_design`.
+    `seed` : int
+        The seed of the design.
+    `replicates` : int
+        The number of independent blocks for the randomised designs.
+    `directions` : list
+        The direction of the importance design, see
+        `importance_directions`.
+    `tilt` : float
+        The size of the shift of the importance design.
+    Returns
+    -------
+    list
+        A dict per simulation of p1 keyed by (error category, system type).
+    """
+    dimensions = p1_dimensions(capacity_error.config)
+    if method == "importance":
+        design, _ = importance_design(N, directions, tilt=tilt, seed=seed)
+    else:
+        design = uniform_design(method, N, len(dimensions), seed=seed,
+                                replicates=replicates)
+    columns = [capacity_error.error_ppf(system_type, design[:, j],
+                                        order="p1", _error=error)
+               for j, (error, system_type) in enumerate(dimensions)]
+    return [{dimension: float(column[i])
+             for dimension, column in zip(dimensions, columns)}
+            for i in range(N)]
+
+
+def variance_reduction(results, method, N=None, replicates=10):
+    """
+    Estimate the variance reduction of the mean of `results` against plain
+    Monte Carlo with the same number of simulations.
+
+    The variance of the mean is estimated from the spread of the means of
+    the independent blocks of the design, and compared with s^2 / n.
+
+    Parameters
+    ----------
+    `results` : list
+        The national capacities, in the order of the design.
+    `method` : string
+        The sampling method of the design.
+    `N` : int
+        The number of simulations the design was built for, defaults to the
+        number of results.
+    `replicates` : int
+        The number of blocks the design was built with.
+    Returns
+    -------
+    float
+        The ratio of the plain Monte Carlo variance of the mean to the
+        variance of the mean under the design, > 1 is an improvement.
+    """
+    results = np.asarray(results, dtype=float)
+    size = block_size(method, len(results) if N is None else N, replicates)
+    n_blocks = len(results) // size
+    if n_blocks < 2:
+        return np.nan
+    block_means = results[:n_blocks * size].reshape(n_blocks, size).mean(axis=1)
+    design_variance = block_means.var(ddof=1) / n_blocks
+    plain_variance = results.var(ddof=1) / (n_blocks * size)
+    if design_variance == 0:
+        return np.inf
+    return plain_variance / design_variance
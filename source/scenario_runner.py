@@ -0,0 +1,256 @@
+"""
+Run the Monte Carlo simulation for several capacity error configs, or
+scenarios, against one loaded site list.
+
+Each scenario is either a whole config, given as a CapacityError or the
+file written by `capacity_error_config_writer.main`, or a dict of overrides
+merged into the baseline config, e.g.
+{"offline": {"domestic": {"p1": ["normal", [0.06, 0.05]]}}}. Each scenario
+is written to its own ResultsStore in the output directory, so it can be
+resumed, and the results of every scenario are combined into one table
+keyed by scenario.
+
+With common random numbers every scenario runs the same seeds, by default
+with the keyed random streams, so the draws of each site are shared and the
+differences between scenarios are due to the configs rather than to noise.
+"""
+
+import os
+import copy
+import json
+import numpy as np
+import pandas as pd
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList
+from site_list_monte_carlo_simuation import MonteCarloSiteList
+from results_store import load_results
+
+
+def merge_config(config, overrides):
+    """
+    Return a copy of a capacity error config with overrides merged in.
+
+    Parameters
+    ----------
+    `config` : dict
+        The baseline config.
+    `overrides` : dict
+        Nested like the config, each value replaces the one at the same
+        place in the config, except for dicts which are merged.
+    Returns
+    -------
+    dict
+    """
+    merged = copy.deepcopy(config)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+class ScenarioRunner:
+    """
+    A class to run the monte carlo simulation for several capacity error
+    configs with one site list.
+    """
+
+    def __init__(self, scenarios, N=100, out_dir="../data/scenarios",
+                 common_random_numbers=True, seed=None, baseline=None,
+                 test=False, **options):
+        """
+        Parameters
+        ----------
+        `scenarios` : dict
+            The scenarios keyed by name, each a CapacityError, a config file
+            or a dict of overrides of the baseline config. A list is named
+            "scenario_0", "scenario_1"... The names are the directories of
+            the results in `out_dir`.
+        `N` : int
+            The number of simulations of each scenario.
+        `out_dir` : string
+            The directory of the results.
+        `common_random_numbers` : bool
+            Run every scenario with the same seeds.
+        `seed` : int
+            Optionally the seed of the generator of the seeds, otherwise it
+            is seeded from the OS. The seeds are saved in `out_dir`, so an
+            interrupted run can be resumed either way.
+        `baseline` : CapacityError
+            The config the overrides are merged into, by default loaded from
+            'Config/capacity_error.txt'.
+        `test` : bool
+            Load the test site list.
+        `options` : dict
+            Options of every MonteCarloSiteList, e.g. workers or
+            national_total. With common random numbers keyed_streams
+            defaults to True.
+        """
+        if not isinstance(scenarios, dict):
+            scenarios = {"scenario_{}".format(i): scenario
+                         for i, scenario in enumerate(scenarios)}
+        for name in scenarios:
+            if not name or os.path.basename(name) != name or \
+                    name in (".", ".."):
+                raise ValueError("Invalid scenario name {}, the names must "
+                                 "be valid directory names.".format(name))
+        self.scenarios = scenarios
+        self.N = int(N)
+        self.out_dir = out_dir
+        self.common_random_numbers = common_random_numbers
+        self.seed = seed
+        self.baseline = baseline
+        self.test = test
+        if common_random_numbers:
+            options.setdefault("keyed_streams", True)
+        self.options = options
+        self.base = None
+
+    def capacity_error(self, scenario):
+        """Return the CapacityError of a scenario."""
+        if isinstance(scenario, CapacityError):
+            return scenario
+        if isinstance(scenario, str):
+            return CapacityError(config=CapacityError.load_config(scenario))
+        if self.baseline is None:
+            self.baseline = CapacityError()
+        return CapacityError(config=merge_config(self.baseline.config,
+                                                 scenario))
+
+    def get_seeds(self):
+        """
+        Return the seeds of each scenario, keyed by name.
+
+        The seeds are drawn once and saved in `out_dir`, with common random
+        numbers as one list shared by every scenario, otherwise as distinct
+        seeds for each scenario.
+
+        Raises
+        ------
+        FileExistsError
+            If `out_dir` holds seeds for different scenarios or N.
+        """
+        file = os.path.join(self.out_dir, "seeds.json")
+        names = list(self.scenarios)
+        if os.path.isfile(file):
+            with open(file) as fid:
+                seeds = json.load(fid)
+            if sorted(seeds) != sorted(names) or \
+                    any(len(s) != self.N for s in seeds.values()):
+                raise FileExistsError("{} holds results for different "
+                                      "scenarios, please change the output "
+                                      "directory and try again."
+                                      .format(self.out_dir))
+            return seeds
+        rng = np.random.default_rng(self.seed)
+        if self.common_random_numbers:
+            shared = [int(s) for s in rng.choice(2 ** 32, size=self.N,
+                                                 replace=False)]
+            seeds = {name: shared for name in names}
+        else:
+            draws = rng.choice(2 ** 32, size=self.N * len(names),
+                               replace=False)
+            seeds = {name: [int(s) for s in
+                            draws[i * self.N:(i + 1) * self.N]]
+                     for i, name in enumerate(names)}
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(file + ".tmp", "w") as fid:
+            json.dump(seeds, fid)
+        os.replace(file + ".tmp", file)
+        return seeds
+
+    def run(self):
+        """
+        Run every scenario, resuming any interrupted ones, and save the
+        combined results to 'scenario_results.csv' in `out_dir`.
+        """
+        if self.base is None:
+            print("Loading site list...")
+            self.base = BaseSiteList(test=self.test)
+        seeds = self.get_seeds()
+        for name, scenario in self.scenarios.items():
+            print("Running scenario {}...".format(name))
+            mc = MonteCarloSiteList(seeds=seeds[name],
+                                    out_dir=os.path.join(self.out_dir, name),
+                                    base=self.base,
+                                    capacity_error=self.capacity_error(
+                                        scenario),
+                                    test=self.test, **self.options)
+            mc.run()
+        results = self.results()
+        results.to_csv(os.path.join(self.out_dir, "scenario_results.csv"),
+                       index=False)
+        return results
+
+    def results(self):
+        """
+        Return the results of every scenario as one table, with the
+        scenario name in the "scenario" column.
+        """
+        tables = []
+        for name in self.scenarios:
+            table = load_results(os.path.join(self.out_dir, name))
+            table.insert(0, "scenario", name)
+            tables.append(table)
+        return pd.concat(tables, ignore_index=True)
+
+    def differences(self, reference=None):
+        """
+        Compare the national capacity of each scenario with a reference
+        scenario.
+
+        With common random numbers the simulations of the same seed are
+        paired, so the standard error of the difference in the means is
+        that of the paired differences, which is smaller the more the
+        scenarios are correlated. The standard error of independent runs
+        is given for comparison.
+
+        Parameters
+        ----------
+        `reference` : string
+            The name of the reference scenario, by default the first.
+        Returns
+        -------
+        pd.DataFrame
+            The mean and standard deviation of each scenario, the difference
+            in the means from the reference and its paired and independent
+            standard errors, indexed by scenario.
+        """
+        results = self.results()
+        if not np.all(results["weight"] == 1):
+            raise ValueError("The differences do not support the weighted "
+                             "results of importance sampling.")
+        capacities = results.pivot(index="random_seed", columns="scenario",
+                                   values="national_capacity_MW")
+        names = list(self.scenarios)
+        reference = names[0] if reference is None else reference
+        rows = []
+        for name in names:
+            values = results.loc[results["scenario"] == name,
+                                 "national_capacity_MW"]
+            ref = results.loc[results["scenario"] == reference,
+                              "national_capacity_MW"]
+            row = {"scenario": name, "count": values.shape[0],
+                   "mean_MW": values.mean(), "std_MW": values.std(),
+                   "difference_MW": values.mean() - ref.mean(),
+                   "independent_se_MW": np.sqrt(
+                       values.var() / values.shape[0] +
+                       ref.var() / ref.shape[0])}
+            paired = (capacities[name] - capacities[reference]).dropna() \
+                if self.common_random_numbers else pd.Series(dtype=float)
+            row["paired_se_MW"] = paired.std() / np.sqrt(paired.shape[0]) \
+                if paired.shape[0] > 1 else np.nan
+            rows.append(row)
+        return pd.DataFrame(rows).set_index("scenario")
+
+
+if __name__ == "__main__":
+    runner = ScenarioRunner(
+        {"baseline": {},
+         "high_offline": {"offline": {"domestic": {
+             "p1": ["normal", [0.06, 0.05]]}}}},
+        N=100, seed=1
+    )
+    runner.run()
+    print(runner.differences())
@@ -0,0 +1,464 @@
+"""
+Global sensitivity analysis of the national capacity to the parameters of
+the capacity error config.
+
+The parameters (e.g. the mean of the domestic "offline" p1, or the scale of
+the non-domestic "site_uncertainty" Johnson SU p2) are varied over ranges
+with a Saltelli design: two Sobol matrices A and B of parameter values,
+and for each parameter i the matrix AB_i, which is A with column i taken
+from B. Each row is a capacity error config, evaluated by a statistic (by
+default the mean) of the national capacity over a set of simulations, with
+the same seeds and p1 design for every config so that the differences
+between configs are not swamped by Monte Carlo noise.
+
+The first-order index of a parameter (Saltelli et al. 2010) is the share of
+the variance of the statistic explained by the parameter alone, and the
+total-effect index (Jansen 1999) the share including its interactions with
+the other parameters. Confidence intervals are found by bootstrapping the
+rows of the design.
+"""
+
+import copy
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+from capacity_error import CapacityError
+from sampling_designs import p1_parameters
+import site_list_monte_carlo_simuation as mc
+
+# the names of the parameters of each pdf of the config, in order
+PDF_PARAMETERS = {"normal": ("mean", "sd"),
+                  "johnson_su": ("a", "b", "loc", "scale"),
+                  "uniform": ("value",)}
+
+
+def config_parameters(config, pdfs=("normal", "johnson_su")):
+    """
+    Return the names of the parameters of the pdfs of a capacity error
+    config.
+
+    Parameters
+    ----------
+    `config` : dict
+        The capacity error config.
+    `pdfs` : tuple
+        The pdfs whose parameters are returned, by default those that are
+        random rather than constant.
+    Returns
+    -------
+    list
+        The names, as "error.system_type.order.parameter", e.g.
+        "offline.domestic.p1.mean".
+    """
+    return ["{}.{}.{}.{}".format(error, system_type, order, name)
+            for error, entry in sorted(config.items()) if error != "unreported"
+            for system_type, orders in sorted(entry.items())
+            for order, (pdf, _) in sorted(orders.items()) if pdf in pdfs
+            for name in PDF_PARAMETERS[pdf]]
+
+
+def parameter_location(config, parameter):
+    """Return the config entry and index of a named parameter."""
+    error, system_type, order, name = parameter.split(".")
+    pdf, params = config[error][system_type][order]
+    if name not in PDF_PARAMETERS.get(pdf, ()):
+        raise ValueError("Unknown parameter {} of the {} pdf at {}, {}, {}"
+                         .format(name, pdf, error, system_type, order))
+    return params, PDF_PARAMETERS[pdf].index(name)
+
+
+def get_parameter(config, parameter):
+    """Return the value of a named parameter of a capacity error config."""
+    params, index = parameter_location(config, parameter)
+    return params[index]
+
+
+def set_parameters(config, values):
+    """
+    Return a copy of a capacity error config with named parameters set.
+
+    Parameters
+    ----------
+    `config` : dict
+        The capacity error config.
+    `values` : dict
+        The value of each parameter keyed by name, see `config_parameters`.
+    Returns
+    -------
+    dict
+    """
+    config = copy.deepcopy(config)
+    for parameter, value in values.items():
+        params, index = parameter_location(config, parameter)
+        params[index] = float(value)
+    return config
+
+
+def parameter_bounds(config, parameters, bounds=None, spread=0.2):
+    """
+    Return the ranges of named parameters of a capacity error config.
+
+    Parameters
+    ----------
+    `config` : dict
+        The capacity error config.
+    `parameters` : list
+        The names of the parameters, see `config_parameters`.
+    `bounds` : dict
+        Optionally the (lower, upper) bounds of parameters keyed by name,
+        the others are varied by +/- `spread` of their value.
+    `spread` : float
+        The relative range of the parameters without bounds.
+    Returns
+    -------
+    numpy.ndarray
+        The (d, 2) lower and upper bounds of each parameter.
+    """
+    bounds = {} if bounds is None else bounds
+    ranges = np.array([
+        sorted(bounds[parameter]) if parameter in bounds else
+        sorted(get_parameter(config, parameter) *
+               np.array([1 - spread, 1 + spread]))
+        for parameter in parameters
+    ], dtype=float).reshape(-1, 2)
+    fixed = ranges[:, 0] == ranges[:, 1]
+    if fixed.any():
+        raise ValueError("The parameters {} have an empty range, please give "
+                         "their bounds.".format(
+                             [p for p, f in zip(parameters, fixed) if f]))
+    return ranges
+
+
+def saltelli_design(bounds, N, seed=None):
+    """
+    Build the Saltelli design of parameter values.
+
+    Parameters
+    ----------
+    `bounds` : numpy.ndarray
+        The (d, 2) lower and upper bounds of each parameter.
+    `N` : int
+        The number of rows of A and B, a power of 2 balances the Sobol
+        points.
+    `seed` : int
+        The seed of the scrambled Sobol points.
+    Returns
+    -------
+    numpy.ndarray
+        An (N (d + 2), d) array, the rows of A, then B, then each AB_i.
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    d = bounds.shape[0]
+    points = qmc.Sobol(2 * d, scramble=True, seed=seed).random(N)
+    points = qmc.scale(points, np.tile(bounds[:, 0], 2),
+                       np.tile(bounds[:, 1], 2))
+    A, B = points[:, :d], points[:, d:]
+    blocks = [A, B]
+    for i in range(d):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+    return np.concatenate(blocks)
+
+
+def sobol_indices(outputs, d):
+    """
+    Estimate the first-order and total-effect indices from the outputs of
+    a Saltelli design.
+
+    Parameters
+    ----------
+    `outputs` : numpy.ndarray
+        The output of each row of the design, or an (n_bootstrap, N (d + 2))
+        array of them.
+    `d` : int
+        The number of parameters.
+    Returns
+    -------
+    tuple
+        The first-order and total-effect index of each parameter.
+    """
+    outputs = np.atleast_2d(outputs)
+    N = outputs.shape[1] // (d + 2)
+    blocks = outputs.reshape(outputs.shape[0], d + 2, N)
+    # centre the outputs, as the first-order estimator is not translation
+    # invariant and the national capacity varies little about its mean
+    blocks = blocks - blocks[:, :2].mean(axis=(1, 2))[:, np.newaxis,
+                                                      np.newaxis]
+    f_A, f_B, f_AB = blocks[:, 0], blocks[:, 1], blocks[:, 2:]
+    variance = np.concatenate((f_A, f_B), axis=1).var(axis=1)[:, np.newaxis]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        first = (f_B[:, np.newaxis] * (f_AB - f_A[:, np.newaxis])).mean(axis=2) \
+            / variance
+        total = 0.5 * ((f_A[:, np.newaxis] - f_AB) ** 2).mean(axis=2) \
+            / variance
+    return first, total
+
+
+def summarise(capacities, statistic):
+    """Return the statistic ("mean", "std" or a quantile) of capacities."""
+    capacities = np.asarray(capacities, dtype=float)
+    if statistic == "mean":
+        return capacities.mean()
+    if statistic == "std":
+        return capacities.std(ddof=1)
+    if isinstance(statistic, float) and 0 < statistic < 1:
+        return np.quantile(capacities, statistic)
+    raise ValueError("Unknown statistic {}, expected \"mean\", \"std\" or a "
+                     "quantile in (0, 1)".format(statistic))
+
+
+def simulate_config(config, seeds, base, sampling="latin_hypercube",
+                    **options):
+    """
+    Simulate the national capacity with a capacity error config.
+
+    Parameters
+    ----------
+    `config` : dict
+        The capacity error config.
+    `seeds` : list
+        The seed of each simulation.
+    `base` : BaseSiteList
+        The site list.
+    `sampling` : string
+        The design of the p1 parameters of the simulations, seeded by the
+        first seed, see `sampling_designs.p1_parameters`.
+    `options` : dict
+        The engine options, see `simulate_national_capacities`.
+    Returns
+    -------
+    numpy.ndarray
+        The national capacity of each simulation.
+    """
+    capacity_error = CapacityError(config=config)
+    parameters = None if sampling == "random" else \
+        p1_parameters(capacity_error, len(seeds), method=sampling,
+                      seed=seeds[0], replicates=1)
+    results = mc.simulate_national_capacities(seeds, 0, base, capacity_error,
+                                              parameters=parameters,
+                                              **options)
+    return np.array([capacity for capacity, _ in results])
+
+
+def evaluate_config(config, seeds, base, statistic="mean",
+                    sampling="latin_hypercube", **options):
+    """
+    Return a statistic of the national capacity with a capacity error
+    config, see `simulate_config` and `summarise`.
+    """
+    return summarise(simulate_config(config, seeds, base, sampling=sampling,
+                                     **options), statistic)
+
+
+def _evaluate_group(configs, seeds, base, statistics, sampling, options):
+    """Return the statistics of each of a group of configs."""
+    outputs = []
+    for config in configs:
+        capacities = simulate_config(config, seeds, base, sampling=sampling,
+                                     **options)
+        outputs.append([summarise(capacities, statistic)
+                        for statistic in statistics])
+    return outputs
+
+
+def _evaluate_worker(configs, seeds, statistics, sampling, options):
+    """Evaluate a group of configs in a worker process."""
+    return _evaluate_group(configs, seeds, mc._WORKER_INPUTS["base"],
+                           statistics, sampling, options)
+
+
+def evaluate_configs(configs, seeds, base, statistics=("mean",),
+                     sampling="latin_hypercube", workers=1, group_size=8,
+                     **options):
+    """
+    Return statistics of the national capacity with each of a list of
+    capacity error configs, in a process pool if `workers` > 1.
+
+    Parameters
+    ----------
+    `configs` : list
+        The capacity error configs.
+    `seeds` : list
+        The seed of each simulation of every config.
+    `base` : BaseSiteList
+        The site list.
+    `statistics` : tuple
+        The statistics of the national capacity, see `summarise`.
+    `sampling` : string
+        The design of the p1 parameters of the simulations.
+    `workers` : int
+        The number of processes evaluating the configs.
+    `group_size` : int
+        The number of configs sent to a worker at a time.
+    `options` : dict
+        The engine options, see `simulate_national_capacities`.
+    Returns
+    -------
+    numpy.ndarray
+        The (configs, statistics) array of the statistics.
+    """
+    if workers <= 1:
+        outputs = _evaluate_group(configs, seeds, base, statistics, sampling,
+                                  options)
+    else:
+        group_size = max(1, int(group_size))
+        groups = [configs[start:start + group_size]
+                  for start in range(0, len(configs), group_size)]
+        site_list_dir = tempfile.mkdtemp(prefix="site_list_")
+        base.export(site_list_dir)
+        n = len(groups)
+        try:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=mc._init_worker,
+                                     initargs=(site_list_dir, configs[0])) \
+                    as executor:
+                outputs = [output for group_outputs in executor.map(
+                    _evaluate_worker, groups, [seeds] * n, [statistics] * n,
+                    [sampling] * n, [options] * n
+                ) for output in group_outputs]
+        finally:
+            shutil.rmtree(site_list_dir, ignore_errors=True)
+    return np.array(outputs, dtype=float).reshape(len(configs),
+                                                  len(statistics))
+
+
+class SensitivityAnalysis:
+    """
+    The Sobol indices of the national capacity over the parameters of the
+    capacity error config.
+    """
+
+    def __init__(self, base, capacity_error=None, parameters=None,
+                 bounds=None, spread=0.2, N=64, n_simulations=20, seed=None,
+                 statistic="mean", sampling="latin_hypercube", workers=1,
+                 group_size=8, **options):
+        """
+        Parameters
+        ----------
+        `base` : BaseSiteList
+            The site list.
+        `capacity_error` : CapacityError
+            The config whose parameters are varied, by default loaded from
+            'Config/capacity_error.txt'.
+        `parameters` : list
+            The names of the parameters to vary, see `config_parameters`,
+            by default every parameter of the random pdfs.
+        `bounds` : dict
+            Optionally the (lower, upper) bounds of parameters keyed by
+            name, the others are varied by +/- `spread` of their value.
+        `spread` : float
+            The relative range of the parameters without bounds.
+        `N` : int
+            The number of rows of the Saltelli matrices A and B.
+        `n_simulations` : int
+            The number of simulations for each config.
+        `seed` : int
+            The seed of the design and of the simulations.
+        `statistic` : string or float
+            The statistic of the national capacity, see `summarise`.
+        `sampling` : string
+            The design of the p1 parameters of the simulations.
+        `workers` : int
+            The number of processes evaluating the configs.
+        `group_size` : int
+            The number of configs sent to a worker at a time.
+        `options` : dict
+            The engine options, see `simulate_national_capacities`.
+            keyed_streams defaults to True, so each site has the same draws
+            with every config. The national_total engine is faster, but its
+            draws differ once the p1 parameters do, which adds noise to the
+            indices.
+        """
+        self.base = base
+        self.ce = CapacityError() if capacity_error is None else \
+            capacity_error
+        self.parameters = config_parameters(self.ce.config) \
+            if parameters is None else list(parameters)
+        self.bounds = parameter_bounds(self.ce.config, self.parameters,
+                                       bounds, spread)
+        self.N = int(N)
+        self.statistic = statistic
+        self.sampling = sampling
+        self.workers = int(workers)
+        self.group_size = max(1, int(group_size))
+        options.setdefault("keyed_streams", True)
+        self.options = options
+        rng = np.random.default_rng(seed)
+        self.seeds = [int(s) for s in rng.choice(2 ** 32, size=n_simulations,
+                                                 replace=False)]
+        self.design = saltelli_design(self.bounds, self.N,
+                                      seed=rng.integers(2 ** 32))
+        self.outputs = None
+
+    def configs(self):
+        """Yield the capacity error config of each row of the design."""
+        for row in self.design:
+            yield set_parameters(self.ce.config,
+                                 dict(zip(self.parameters, row)))
+
+    def evaluate(self):
+        """
+        Evaluate every row of the design, in a process pool if `workers`
+        > 1.
+
+        Returns
+        -------
+        numpy.ndarray
+            The statistic of the national capacity for each row.
+        """
+        self.outputs = evaluate_configs(
+            list(self.configs()), self.seeds, self.base,
+            statistics=(self.statistic,), sampling=self.sampling,
+            workers=self.workers, group_size=self.group_size, **self.options
+        )[:, 0]
+        return self.outputs
+
+    def indices(self, n_bootstrap=1000, confidence=0.95, seed=None):
+        """
+        Return the first-order and total-effect index of each parameter,
+        with bootstrap confidence intervals.
+
+        Parameters
+        ----------
+        `n_bootstrap` : int
+            The number of bootstrap resamples of the rows of the design.
+        `confidence` : float
+            The confidence level of the intervals.
+        `seed` : int
+            The seed of the bootstrap.
+        Returns
+        -------
+        pd.DataFrame
+            The indices ("S1", "ST") and the bounds of their intervals,
+            indexed by parameter.
+        """
+        if self.outputs is None:
+            self.evaluate()
+        d = len(self.parameters)
+        first, total = sobol_indices(self.outputs, d)
+        rng = np.random.default_rng(seed)
+        resamples = rng.integers(self.N, size=(n_bootstrap, self.N))
+        blocks = self.outputs.reshape(d + 2, self.N)
+        boot_first, boot_total = sobol_indices(
+            blocks[:, resamples].transpose(1, 0, 2).reshape(n_bootstrap, -1),
+            d
+        )
+        alpha = (1 - confidence) / 2
+        return pd.DataFrame({
+            "S1": first[0],
+            "S1_low": np.nanquantile(boot_first, alpha, axis=0),
+            "S1_high": np.nanquantile(boot_first, 1 - alpha, axis=0),
+            "ST": total[0],
+            "ST_low": np.nanquantile(boot_total, alpha, axis=0),
+            "ST_high": np.nanquantile(boot_total, 1 - alpha, axis=0),
+        }, index=pd.Index(self.parameters, name="parameter"))
+
+
+if __name__ == "__main__":
+    from site_list_variation import BaseSiteList
+    self = SensitivityAnalysis(BaseSiteList(), seed=1)
+    print(self.indices().sort_values("ST", ascending=False))
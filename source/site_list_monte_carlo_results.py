@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 from scipy.stats import johnsonsu
 import numpy as np
 import seaborn as sns
+from results_store import load_results
 
 
 class MonteCarloAnalysisResults:
@@ -19,7 +20,7 @@ class MonteCarloAnalysisResults:
         self.results_file = "C:/Users/owenh/Documents/GitRepos/" \
                             "capacity_mismatch_paper/data/" \
                             "MC_results_20200227_10000N.csv"
-        self.data = pd.read_csv(self.results_file)
+        self.data = load_results(self.results_file)
         self.rename_cols()
         self.min = self.data.capacity_MW.min()
         self.max = self.data.capacity_MW.max()
@@ -31,7 +32,7 @@ class MonteCarloAnalysisResults:
 
     def rename_cols(self):
         self.data.rename(
-            {" national_capacity (MW)": "capacity_MW"},
+            {"national_capacity_MW": "capacity_MW"},
             inplace=True, axis=1
         )
 
@@ -3,10 +3,291 @@ import time as TIME
 import pandas as pd
 import os
 import gc
+import hashlib
+import shutil
+import tempfile
 from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 # from generic_tools import print_progress
-from site_list_variation import SiteListVariation
+from site_list_variation import SiteListVariation, BaseSiteList
+from capacity_error import CapacityError
+from batch_site_list_variation import BatchSiteListVariation
+from national_capacity_variation import NationalCapacityVariation
+from online_stats import RunningStatistics, weighted_summary
+from sampling_designs import p1_parameters, variance_reduction, \
+    importance_directions, importance_design
+from results_store import ResultsStore, ResultsWriter
+
+# the site list and capacity error config held by each worker process
+_WORKER_INPUTS = {}
+
+
+def simulate_national_capacity(seed, index, base, capacity_error,
+                               keyed_streams=False, parameters=None,
+                               sparse=False, threads=1):
+    """
+    Run a single site list simulation and return the national capacity and
+    the change in capacity of each stage.
+
+    Parameters
+    ----------
+    `seed` : int
+        The seed for the numpy random number generator.
+    `index` : int
+        The simulation number.
+    `base` : BaseSiteList
+        The preloaded site list.
+    `capacity_error` : CapacityError
+        The preloaded capacity error config.
+    `keyed_streams` : bool
+        Use the counter-based random streams of the SiteListVariation.
+    `parameters` : dict
+        Optionally fix the p1 parameters of the simulation.
+    `sparse` : bool
+        Use the sparse error application of the SiteListVariation.
+    `threads` : int
+        The number of threads simulating chunks of the site list, with the
+        keyed random streams.
+    Returns
+    -------
+    tuple
+        The national capacity of the simulated site list and the change in
+        capacity keyed by (stage, system type).
+    """
+    sl_rvs = SiteListVariation(index, verbose=False, seed=seed,
+                               base=base, capacity_error=capacity_error,
+                               keyed_streams=keyed_streams,
+                               parameters=parameters, sparse=sparse,
+                               threads=threads)
+    sl_rvs.unreported_systems()
+    sl_rvs.simulate_effective_capacity_site_list()
+    return sl_rvs.national_capacity(), sl_rvs.breakdown
+
+
+def simulate_national_capacities(seeds, start, base, capacity_error,
+                                 parameters=None, batch=False,
+                                 national_total=False, keyed_streams=False,
+                                 sparse=False, threads=1):
+    """
+    Run a group of site list simulations and return the national capacities.
+
+    Parameters
+    ----------
+    `seeds` : list
+        The seed of each simulation in the group.
+    `start` : int
+        The simulation number of the first simulation in the group.
+    `base` : BaseSiteList
+        The preloaded site list.
+    `capacity_error` : CapacityError
+        The preloaded capacity error config.
+    `parameters` : list
+        Optionally fix the p1 parameters of each simulation, as a dict per
+        seed keyed by (error category, system type).
+    `batch` : bool
+        Simulate the whole group in one pass of the BatchSiteListVariation,
+        otherwise each seed is run through the SiteListVariation in turn.
+    `national_total` : bool
+        Only simulate the national capacity with the
+        NationalCapacityVariation, without building each site list.
+    `keyed_streams` : bool
+        Use the counter-based random streams of the SiteListVariation.
+    `sparse` : bool
+        Use the sparse error application of the SiteListVariation.
+    `threads` : int
+        The number of threads simulating chunks of each site list, with the
+        keyed random streams and neither `batch` nor `national_total`.
+    Returns
+    -------
+    list
+        The national capacity and breakdown of each simulation, as returned
+        by `simulate_national_capacity`, in the order of `seeds`.
+    """
+    if parameters is None:
+        parameters = [None] * len(seeds)
+    if batch:
+        sl_rvs = BatchSiteListVariation(seeds, verbose=False, base=base,
+                                        capacity_error=capacity_error,
+                                        parameters=[p or {} for p in parameters])
+        sl_rvs.unreported_systems()
+        capacities = sl_rvs.simulate_effective_capacity_site_list().tolist()
+        return [(capacity, {key: float(change[k])
+                            for key, change in sl_rvs.breakdown.items()})
+                for k, capacity in enumerate(capacities)]
+    if national_total:
+        results = []
+        for seed, parameter in zip(seeds, parameters):
+            sl_rvs = NationalCapacityVariation(seed, base=base,
+                                               capacity_error=capacity_error,
+                                               parameters=parameter)
+            sl_rvs.unreported_systems()
+            results.append(
+                (sl_rvs.simulate_effective_capacity_site_list(),
+                 sl_rvs.breakdown)
+            )
+        return results
+    return [simulate_national_capacity(seed, start + i, base, capacity_error,
+                                       keyed_streams=keyed_streams,
+                                       parameters=parameter, sparse=sparse,
+                                       threads=threads)
+            for i, (seed, parameter) in enumerate(zip(seeds, parameters))]
+
+
+def simulation_parameters(seed, manifest, capacity_error):
+    """
+    Return the p1 parameters a run's sampling design gave the simulation of
+    `seed`, or None if they were drawn within the simulation.
+    """
+    seeds = manifest["seeds"]
+    if seed not in seeds:
+        raise ValueError("Seed {} is not one of the run's seeds.".format(seed))
+    options = manifest["options"]
+    if options["sampling"] == "random":
+        return None
+    return p1_parameters(capacity_error, len(seeds),
+                         method=options["sampling"], seed=seeds[0],
+                         replicates=options["replicates"],
+                         directions=options.get("directions"),
+                         tilt=options.get("tilt"))[seeds.index(seed)]
+
+
+def simulation_engine(seed, options, base, capacity_error, parameters=None,
+                      index=0, threads=1):
+    """
+    Build the engine of one simulation of a Monte Carlo run, before its
+    unreported sites are added.
+
+    Parameters
+    ----------
+    `seed` : int
+        The seed of the simulation.
+    `options` : dict
+        The engine options of the run, as recorded in its manifest.
+    `base` : BaseSiteList
+        The site list the run was made with.
+    `capacity_error` : CapacityError
+        The capacity error config the run was made with.
+    `parameters` : dict
+        The p1 parameters fixed for the simulation, if any.
+    `index` : int
+        The simulation number.
+    `threads` : int
+        The number of threads simulating chunks of the site list, if the
+        run used the keyed random streams.
+    Returns
+    -------
+    object
+        A SiteListVariation, BatchSiteListVariation or
+        NationalCapacityVariation.
+    """
+    if options["batch"]:
+        return BatchSiteListVariation([seed], base=base,
+                                      capacity_error=capacity_error,
+                                      parameters=[parameters or {}])
+    if options["national_total"]:
+        return NationalCapacityVariation(seed, base=base,
+                                         capacity_error=capacity_error,
+                                         parameters=parameters)
+    return SiteListVariation(index, verbose=False, seed=seed, base=base,
+                             capacity_error=capacity_error,
+                             keyed_streams=options["keyed_streams"],
+                             parameters=parameters, sparse=options["sparse"],
+                             threads=threads if options["keyed_streams"]
+                             else 1)
+
+
+def reconstruct_site_list(seed, manifest, base, capacity_error,
+                          national_capacity=None):
+    """
+    Rebuild the site list of one simulation of a Monte Carlo run.
+
+    See `reconstruct_simulation`.
+
+    Returns
+    -------
+    tuple
+        The site list as a DataFrame and its national capacity.
+    """
+    rows, capacity, total = reconstruct_simulation(
+        seed, manifest, base, capacity_error,
+        national_capacity=national_capacity
+    )
+    return base.frame(capacity, rows), total
+
+
+def reconstruct_simulation(seed, manifest, base, capacity_error,
+                           national_capacity=None, threads=1):
+    """
+    Rebuild the per-site capacities of one simulation of a Monte Carlo run.
+
+    Only the simulation of `seed` is run, with the engine, options and p1
+    sampling design recorded in the run manifest, so its per-site
+    capacities are the same as in the original run.
+
+    Parameters
+    ----------
+    `seed` : int
+        The seed of the simulation.
+    `manifest` : dict
+        The run manifest, see `ResultsStore.read_manifest`.
+    `base` : BaseSiteList
+        The site list the run was made with.
+    `capacity_error` : CapacityError
+        The capacity error config the run was made with.
+    `national_capacity` : float
+        Optionally the national capacity recorded for the simulation, which
+        the rebuilt site list is checked against.
+    `threads` : int
+        The number of threads simulating chunks of the site list, if the
+        run used the keyed random streams.
+    Returns
+    -------
+    tuple
+        The base row and capacity of every site, and the national capacity.
+    """
+    if manifest["site_list"] != base.checksum() or \
+            manifest["capacity_error"] != capacity_error.checksum():
+        raise ValueError("The site list or capacity error config differs "
+                         "from the one the run was made with.")
+    parameters = simulation_parameters(seed, manifest, capacity_error)
+    index = manifest["seeds"].index(seed)
+    options = manifest["options"]
+    sl_rvs = simulation_engine(seed, options, base, capacity_error,
+                               parameters=parameters, index=index,
+                               threads=threads)
+    sl_rvs.unreported_systems()
+    if options["batch"]:
+        total = sl_rvs.simulate_effective_capacity_site_list()[0]
+    elif options["national_total"]:
+        total = sl_rvs.simulate_effective_capacity_site_list()
+    else:
+        sl_rvs.simulate_effective_capacity_site_list()
+        total = sl_rvs.national_capacity()
+    rows, capacity = sl_rvs.site_capacities()
+    if national_capacity is not None and \
+            not np.isclose(total, national_capacity, rtol=1e-9, atol=0):
+        raise ValueError("The national capacity of the rebuilt site list, {}, "
+                         "differs from the recorded national capacity, {}."
+                         .format(total, national_capacity))
+    return rows, capacity, total
+
+
+def _init_worker(site_list_dir, config=None):
+    """
+    Attach each worker process to the exported site list, which is memory
+    mapped read-only so the workers share one copy of it, and build the
+    capacity error config of the run.
+    """
+    _WORKER_INPUTS["base"] = BaseSiteList.attach(site_list_dir)
+    _WORKER_INPUTS["capacity_error"] = CapacityError(config=config)
+
+
+def _run_worker(seeds, start, parameters, options):
+    """Run a group of simulations in a worker process."""
+    return simulate_national_capacities(seeds, start, parameters=parameters,
+                                        **options, **_WORKER_INPUTS)
 
 
 class MonteCarloSiteList:
@@ -16,16 +297,57 @@ class MonteCarloSiteList:
     installed PV site list
     """
 
-    def __init__(self, sd_file=None, N=100, n=10):
+    def __init__(self, sd_file=None, N=100, n=10, test=False, workers=1,
+                 batch=1, national_total=False, keyed_streams=False,
+                 tolerance=None, confidence=0.95, min_N=100,
+                 sampling="random", replicates=10, sparse=False,
+                 flush_interval=60., tilt=1.5, seeds=None, out_dir=None,
+                 base=None, capacity_error=None, threads=1):
         self.random_seeds = MonteCarloSiteList.load_seeds(sd_file) if sd_file is not None else None
-        self.N = int(N) if sd_file is None else len(self.random_seeds)
+        if seeds is not None:
+            self.random_seeds = [int(seed) for seed in seeds]
+        self.N = int(N) if self.random_seeds is None else len(self.random_seeds)
         self.n = int(n)
         if self.random_seeds is not None:
             assert len(self.random_seeds) == self.N, \
                 "N must match the number of random_seeds"
         self.clock_seeds = []
         self.national_capacity = []
-        self.out_file = "../data/MC_results_v2_T0only_20200430_{}N.csv".format(self.N)
+        self.out_dir = "../data/MC_results_v2_T0only_20200430_{}N".format(self.N) \
+            if out_dir is None else out_dir
+        self.store = ResultsStore(self.out_dir)
+        # the longest time (s) a result waits before it is written
+        self.flush_interval = flush_interval
+        self.test = test
+        self.workers = int(workers)
+        self.batch = int(batch)
+        self.national_total = national_total
+        self.keyed_streams = keyed_streams
+        self.sparse = sparse
+        # threads per simulation, which do not change the results
+        self.threads = int(threads)
+        # stop early once the confidence intervals on the mean and the
+        # 1%/99% quantiles are narrower than the tolerance (MW)
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.min_N = int(min_N)
+        self.stats = RunningStatistics(quantiles=(0.01, 0.99))
+        # the design of the per-simulation p1 parameters, one of
+        # sampling_designs.SAMPLING_METHODS
+        self.sampling = sampling
+        self.replicates = int(replicates)
+        # the shift of the "importance" design towards the tails, and the
+        # likelihood ratio weight of each simulation under it
+        self.tilt = tilt
+        self.weights = None
+        if sampling == "importance" and tolerance is not None:
+            raise ValueError("The convergence test does not support the "
+                             "weighted results of importance sampling.")
+        self.capacities = []
+        # the site list and capacity error config, loaded on first use
+        # unless given
+        self.base = base
+        self.ce = capacity_error
 
     @staticmethod
     def grouper(iterable, n, fillvalue=None):
@@ -36,29 +358,281 @@ class MonteCarloSiteList:
 
     def run(self):
 
-        """Execute methods and save data to file."""
+        """
+        Execute methods and save data to file.
 
-        if os.path.isfile(self.out_file):
-            raise FileExistsError("Please change the output file "
-                                  "and try again.")
+        If the output directory holds the results of an interrupted run
+        with the same site list, capacity error config and options, the run
+        is resumed, skipping the seeds whose results have been written.
+        """
         tstart = TIME.time()
+        self.load_inputs()
+        seeds = self.resume()
+        parameters = self.get_parameters(seeds)
+        completed = self.completed_results()
+        for seed in seeds:
+            if seed in completed:
+                self.stats.update(completed[seed])
+        weights = [1.] * len(seeds) if self.weights is None else self.weights
+        remaining = [i for i, seed in enumerate(seeds)
+                     if seed not in completed]
+        if completed:
+            print("Resuming, {} of {} simulations already completed..."
+                  .format(len(seeds) - len(remaining), len(seeds)))
+        if self.tolerance is not None and \
+                self.stats.converged(self.tolerance, self.confidence,
+                                     self.min_N):
+            remaining = []
         print("Executing Monte Carlo simulation...")
         # TODO
         #  self.clock_seeds variable needs a better name
-        count = 0
-        for sim in range(self.N):
-            seed = int(TIME.time()) if self.random_seeds is None else self.random_seeds[sim]
-            self.clock_seeds.append(seed)
-            self.run_mc(seed, sim)
-            count += 1
-            if count // self.n:
-                self.write_results_to_csv(self.clock_seeds,
-                                          self.national_capacity)
-                count = 0
-                self.clock_seeds = []
-                self.national_capacity = []
+        results = self.simulate(
+            [seeds[i] for i in remaining],
+            None if parameters is None else [parameters[i] for i in remaining]
+        )
+        # the results are written in chunks of n by a background thread,
+        # and any still queued are written if the run is interrupted
+        with ResultsWriter(self.store, chunk_size=self.n,
+                           interval=self.flush_interval) as writer:
+            try:
+                for i, (national_capacity, breakdown) in zip(remaining,
+                                                             results):
+                    seed = seeds[i]
+                    print(national_capacity)
+                    writer.put(seed, national_capacity, breakdown,
+                               weight=weights[i])
+                    self.clock_seeds.append(seed)
+                    self.stats.update(national_capacity)
+                    if self.tolerance is not None and \
+                            self.stats.converged(self.tolerance,
+                                                 self.confidence, self.min_N):
+                        print("Converged after {} simulations...".format(
+                            self.stats.count))
+                        break
+            finally:
+                results.close()
+        completed = self.completed_results()
+        self.capacities = [completed[seed] for seed in seeds
+                           if seed in completed]
 
         print("Finished, time taken {}...".format(TIME.time() - tstart))
+        print(self.stats.summary(self.confidence))
+        if self.weights is not None:
+            print("Importance sampling estimates: {}".format(weighted_summary(
+                self.capacities, [weights[i] for i, seed in enumerate(seeds)
+                                  if seed in completed]
+            )))
+        elif parameters is not None:
+            print("Variance reduction of the mean ({} sampling): {}".format(
+                self.sampling, variance_reduction(self.capacities,
+                                                  self.sampling, N=len(seeds),
+                                                  replicates=self.replicates)))
+
+    def get_seeds(self):
+        """
+        Return the seed for every simulation in the run.
+
+        Seeds are fixed before any simulation starts, so the results do not
+        depend on the number of workers. If no seeds file was given, N
+        distinct seeds are drawn from a generator seeded with fresh entropy
+        from the OS, so runs started together do not share seeds. Repeated
+        seeds in a seeds file are dropped, as they would only repeat a
+        simulation.
+
+        Returns
+        -------
+        list
+            A list of distinct int seeds.
+        """
+        if self.random_seeds is not None:
+            seeds = list(dict.fromkeys(int(seed)
+                                       for seed in self.random_seeds))
+            if len(seeds) < len(self.random_seeds):
+                print("Dropped {} duplicate seeds...".format(
+                    len(self.random_seeds) - len(seeds)))
+            return seeds
+        rng = np.random.default_rng()
+        return [int(seed) for seed in
+                rng.choice(2 ** 32, size=self.N, replace=False)]
+
+    def run_manifest(self, seeds):
+        """
+        Return the manifest of the run, which identifies its results.
+
+        Parameters
+        ----------
+        `seeds` : list
+            The seed of every simulation in the run.
+        Returns
+        -------
+        dict
+            The hashes of the site list, the capacity error config and the
+            seeds, the options that change the results and the seeds.
+        """
+        seeds_hash = hashlib.sha256(
+            np.asarray(seeds, dtype=np.int64).tobytes()
+        ).hexdigest()
+        return {"site_list": self.base.checksum(),
+                "capacity_error": self.ce.checksum(),
+                "seeds_hash": seeds_hash,
+                "options": {"batch": self.batch > 1,
+                            "national_total": self.national_total,
+                            "keyed_streams": self.keyed_streams,
+                            "sparse": self.sparse,
+                            "sampling": self.sampling,
+                            "replicates": self.replicates,
+                            "tilt": self.tilt,
+                            "directions": self.importance_directions()},
+                "seeds": seeds}
+
+    def resume(self):
+        """
+        Return the seeds of the run, those of the results in the output
+        directory if it has any, otherwise new seeds which are saved in the
+        run manifest before any simulation starts.
+
+        Raises
+        ------
+        FileExistsError
+            If the output directory holds results of a different run.
+        """
+        manifest = self.store.read_manifest()
+        if manifest is None:
+            if self.store.exists():
+                raise FileExistsError("{} holds results without a manifest, "
+                                      "please change the output directory "
+                                      "and try again.".format(self.out_dir))
+            seeds = self.get_seeds()
+            self.store.write_manifest(self.run_manifest(seeds))
+            return seeds
+        seeds = manifest["seeds"]
+        if (self.random_seeds is None and len(seeds) != self.N) or \
+                (self.random_seeds is not None and self.get_seeds() != seeds):
+            raise FileExistsError("{} holds results for different seeds, "
+                                  "please change the output directory and "
+                                  "try again.".format(self.out_dir))
+        if self.run_manifest(seeds) != manifest:
+            raise FileExistsError("{} holds results for a different site "
+                                  "list, capacity error config or options, "
+                                  "please change the output directory and "
+                                  "try again.".format(self.out_dir))
+        return seeds
+
+    def completed_results(self):
+        """Return the national capacities in the store, keyed by seed."""
+        results = self.store.read()
+        return dict(zip(results["random_seed"].tolist(),
+                        results["national_capacity_MW"].tolist()))
+
+    def get_parameters(self, seeds):
+        """
+        Return the p1 parameters of every simulation in the run, drawn from
+        the sampling design, or None to draw them within each simulation.
+
+        The design is seeded by the first seed so that it is reproducible
+        from the seeds file.
+        """
+        if self.sampling == "random":
+            return None
+        if self.ce is None:
+            self.ce = CapacityError()
+        directions = self.importance_directions()
+        if self.sampling == "importance":
+            _, weights = importance_design(len(seeds), directions,
+                                           tilt=self.tilt, seed=seeds[0])
+            self.weights = weights.tolist()
+        return p1_parameters(self.ce, len(seeds), method=self.sampling,
+                             seed=seeds[0], replicates=self.replicates,
+                             directions=directions, tilt=self.tilt)
+
+    def importance_directions(self):
+        """
+        Return the direction of the importance design, or None if the run
+        does not use importance sampling.
+        """
+        if self.sampling != "importance":
+            return None
+        self.load_inputs()
+        type_indices = self.base.type_indices()
+        capacities = {system_type: float(self.base.capacity[rows].sum())
+                      for system_type, rows in type_indices.items()}
+        counts = {system_type: rows.shape[0]
+                  for system_type, rows in type_indices.items()}
+        return importance_directions(self.ce, capacities, counts)
+
+    def simulate(self, seeds, parameters=None):
+        """
+        Run a simulation for each seed, in a process pool if `workers` > 1.
+        The workers memory map a copy of the site list exported to a
+        temporary directory, rather than each loading the csv file.
+
+        If `batch` > 1 the seeds are simulated in groups of `batch` with the
+        BatchSiteListVariation. If `national_total` is set, only the national
+        capacity is simulated, with the NationalCapacityVariation.
+
+        Parameters
+        ----------
+        `seeds` : list
+            The seed for each simulation.
+        `parameters` : list
+            Optionally the p1 parameters of each simulation.
+        Returns
+        -------
+        iterator
+            The national capacity and breakdown of each simulation, in the
+            order of `seeds`.
+        """
+        size = max(1, self.batch)
+        starts = range(0, len(seeds), size)
+        groups = [seeds[start:start + size] for start in starts]
+        if parameters is None:
+            parameters = [None] * len(seeds)
+        parameter_groups = [parameters[start:start + size]
+                            for start in starts]
+        options = {"batch": self.batch > 1,
+                   "national_total": self.national_total,
+                   "keyed_streams": self.keyed_streams,
+                   "sparse": self.sparse,
+                   "threads": self.threads}
+        if self.workers <= 1:
+            self.load_inputs()
+            for start, group, parameter_group in zip(starts, groups,
+                                                     parameter_groups):
+                yield from simulate_national_capacities(
+                    group, start, self.base, self.ce,
+                    parameters=parameter_group, **options
+                )
+            return
+        chunksize = max(1, min(self.n // size,
+                               len(groups) // (4 * self.workers)))
+        self.load_inputs()
+        site_list_dir = tempfile.mkdtemp(prefix="site_list_")
+        self.base.export(site_list_dir)
+        executor = ProcessPoolExecutor(max_workers=self.workers,
+                                       initializer=_init_worker,
+                                       initargs=(site_list_dir,
+                                                 self.ce.config))
+        try:
+            for capacities in executor.map(_run_worker, groups, starts,
+                                           parameter_groups,
+                                           [options] * len(groups),
+                                           chunksize=chunksize):
+                yield from capacities
+        finally:
+            # drop any simulations not yet started if the run stops early
+            executor.shutdown(wait=True, cancel_futures=True)
+            shutil.rmtree(site_list_dir, ignore_errors=True)
+
+    def load_inputs(self):
+        """
+        Load the site list and capacity error config once, to be shared by
+        every simulation in the run.
+        """
+        if self.base is None:
+            print("Loading site list...")
+            self.base = BaseSiteList(test=self.test)
+        if self.ce is None:
+            self.ce = CapacityError()
 
     def run_mc(self, seed, index):
         """
@@ -77,10 +651,12 @@ class MonteCarloSiteList:
         """
         # TODO
         #  fix sim parameter in SiteListVariation - not acting as intended here
-        sl_rvs = SiteListVariation(index, verbose=False, seed=seed, test=False)
+        self.load_inputs()
+        sl_rvs = SiteListVariation(index, verbose=False, seed=seed,
+                                   base=self.base, capacity_error=self.ce)
         sl_rvs.unreported_systems()
         sl_rvs.simulate_effective_capacity_site_list()
-        sl = sl_rvs.SL.copy()
+        sl = sl_rvs.SL
         self.sim_stats(sl)
         del sl_rvs
         return sl
@@ -103,30 +679,10 @@ class MonteCarloSiteList:
         print(national_capacity)
         self.national_capacity.append(national_capacity)
 
-    def write_results_to_csv(self, seeds, capacities):
-        """
-
-        Write results to csv using append method.
-
-        Parameters
-        ----------
-        seeds: list,
-            Random seeds used in analysis
-        capacities: list,
-            National capacities generated from the site list permutations.
-
-        """
-        if os.path.isfile(self.out_file):
-            with open(self.out_file, 'a') as out:
-                for seed, capacity in zip(seeds, capacities):
-                    out.write("{},{}\n".format(seed, capacity))
-        else:
-            with open(self.out_file, 'w') as out:
-                out.write("random_seed, national_capacity (MW)\n")
-                for seed, capacity in zip(seeds, capacities):
-                    out.write("{},{}\n".format(seed, capacity))
     @staticmethod
     def load_seeds(file):
+        if os.path.isdir(file):
+            return ResultsStore(file).read()["random_seed"].tolist()
         seeds = []
         with open(file, 'r') as fid:
             next(fid)
@@ -136,6 +692,7 @@ class MonteCarloSiteList:
                 seeds.append(int(data[0]))
         return seeds
 
-input_seeds_file = "../data/results_10N.csv"
-MC_instance = MonteCarloSiteList(N=1000, n=1)
-MC_instance.run()
\ No newline at end of file
+if __name__ == "__main__":
+    input_seeds_file = "../data/results_10N.csv"
+    MC_instance = MonteCarloSiteList(N=1000, n=1)
+    MC_instance.run()
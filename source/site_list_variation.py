@@ -4,28 +4,457 @@ as defined by the national PV site list.
 """
 
 import os
+import json
+import hashlib
 import pandas as pd
 from configparser import ConfigParser
 import numpy as np
 import errno
+from concurrent.futures import ThreadPoolExecutor
 from capacity_error import CapacityError as ce
+from random_streams import RandomStreams, SYSTEM_TYPE_CODES, UNREPORTED_ID
+from error_kernels import stage_kernel
+
+# the typed columns of a BaseSiteList, as saved by BaseSiteList.export
+SITE_LIST_ARRAYS = ("capacity", "system_type_code", "domestic", "site_id",
+                    "latitude", "longitude")
+
+# the error categories, in the order they are applied to the site list
+ERROR_STAGES = ("decommissioned", "site_uncertainty", "revised_up",
+                "revised_down", "offline", "network_outage")
+
+
+class BaseSiteList:
+    """
+    The site list as loaded from file, held read-only so that it can be
+    shared by reference between many simulations.
+
+    The columns used by the simulations are held as typed arrays: the
+    capacity, the system type as an int8 code (see SYSTEM_TYPE_CODES, -1
+    where the capacity is missing), the integer site id and, where the site
+    list has them, the coordinates. The remaining columns are only used to
+    build site list DataFrames.
+
+    The site id is the "site_id" column of the site list file if it has
+    one, otherwise the row number. The keyed random streams draw each
+    site's outcome by its site id, so with a "site_id" column the outcome
+    of a site does not depend on the order of the file.
+    """
+
+    def __init__(self, config=None, test=False, cut_off=10, n_rows=1000,
+                 dtype=np.float64):
+        """
+        Parameters
+        ----------
+        `config` : dict
+            Optionally provide the site list config, otherwise it is loaded
+            from 'Config/site_list.ini'.
+        `test` : bool
+            Test with a subset of `n_rows` sites.
+        `cut_off` : float
+            The capacity (kW) from which systems are non-domestic.
+        `dtype` : numpy.dtype
+            The dtype of the capacity and coordinates, float32 halves the
+            memory of each simulation.
+        """
+        self.config = SiteListVariation.load_config() if config is None \
+            else config
+        self.test = test # test with subset of 1000 sites
+        self.cut_off = cut_off
+        self.dtype = np.dtype(dtype)
+        SL = self.read_site_list(self.config["sl_file"], test=test,
+                                 cut_off=cut_off, n_rows=n_rows)
+        self.columns = list(SL.columns)
+        self.capacity = self.read_only(SL["Capacity"].to_numpy(dtype=self.dtype))
+        self.system_type_code = np.full(self.capacity.shape[0], -1,
+                                        dtype=np.int8)
+        self.system_type_code[self.capacity < cut_off] = \
+            SYSTEM_TYPE_CODES["domestic"]
+        self.system_type_code[self.capacity >= cut_off] = \
+            SYSTEM_TYPE_CODES["non_domestic"]
+        self.read_only(self.system_type_code)
+        self.domestic = self.read_only(
+            self.system_type_code == SYSTEM_TYPE_CODES["domestic"]
+        )
+        self.site_id = self.read_only(SL.index.to_numpy(dtype=np.int64))
+        self.latitude = self.longitude = None
+        if "latitude" in SL and "longitude" in SL:
+            self.latitude = self.read_only(SL["latitude"].to_numpy(dtype=self.dtype))
+            self.longitude = self.read_only(SL["longitude"].to_numpy(dtype=self.dtype))
+        self._static = SL.drop(columns=["Capacity", "system_type"])
+        self.directory = None
+        self._type_indices = None
+        self._band_indices = None
+
+    @property
+    def static(self):
+        """
+        The columns of the site list that are not changed by the simulations,
+        read on first use if the site list was attached from an export.
+        """
+        if self._static is None:
+            self._static = pd.read_pickle(
+                os.path.join(self.directory, "static.pkl")
+            )
+        return self._static
+
+    def checksum(self):
+        """
+        Return a hash of the columns used by the simulations, to identify the
+        results the site list produced.
+        """
+        digest = hashlib.sha256()
+        for array in (self.site_id, self.capacity, self.system_type_code):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def export(self, directory):
+        """
+        Save the site list to `directory` so that it can be attached to by
+        other processes without reading the csv file.
+
+        The typed columns are saved as .npy files, which are memory mapped
+        by `attach`, so every process shares the same pages of memory. The
+        other columns are pickled and only read if a DataFrame is built.
+
+        Parameters
+        ----------
+        `directory` : string
+            The directory to save to, which is created if needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in SITE_LIST_ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(directory, name + ".npy"), array)
+        self.static.to_pickle(os.path.join(directory, "static.pkl"))
+        metadata = {"config": self.config, "test": self.test,
+                    "cut_off": self.cut_off, "dtype": self.dtype.str,
+                    "columns": self.columns}
+        with open(os.path.join(directory, "site_list.json"), "w") as fid:
+            json.dump(metadata, fid)
+
+    @classmethod
+    def attach(cls, directory):
+        """
+        Load a site list saved by `export`, memory mapping its typed columns
+        read-only rather than copying them into the process.
+
+        Parameters
+        ----------
+        `directory` : string
+            The directory the site list was exported to.
+        Returns
+        -------
+        BaseSiteList
+        """
+        with open(os.path.join(directory, "site_list.json")) as fid:
+            metadata = json.load(fid)
+        self = cls.__new__(cls)
+        self.config = metadata["config"]
+        self.test = metadata["test"]
+        self.cut_off = metadata["cut_off"]
+        self.dtype = np.dtype(metadata["dtype"])
+        self.columns = metadata["columns"]
+        for name in SITE_LIST_ARRAYS:
+            file = os.path.join(directory, name + ".npy")
+            setattr(self, name, np.load(file, mmap_mode="r")
+                    if os.path.isfile(file) else None)
+        self._static = None
+        self.directory = directory
+        self._type_indices = None
+        self._band_indices = None
+        return self
+
+    @staticmethod
+    def read_only(array):
+        """Copy an array if it is a view and make it read-only."""
+        if array.base is not None:
+            array = array.copy()
+        array.flags.writeable = False
+        return array
+
+    @staticmethod
+    def read_site_list(sl_file, test=False, cut_off=10, n_rows=1000):
+        """Load the site list csv file into a pandas DataFrame."""
+        if test:
+            SL = pd.read_csv(sl_file, nrows=n_rows)
+        else:
+            SL = pd.read_csv(sl_file)
+
+        if "site_id" in SL:
+            if not SL["site_id"].is_unique or (SL["site_id"] < 0).any() or \
+                    (SL["site_id"] >= UNREPORTED_ID).any():
+                raise ValueError("The site ids of {} must be unique integers "
+                                 "in [0, 2 ** 62).".format(sl_file))
+            SL = SL.set_index("site_id")
+
+        # rename site list columns
+        SL.rename({"dc_capacity" : "Capacity"}, inplace=True, axis=1)
+
+        # categorise systems as domestic / non-domestic
+        SL["system_type"] = None
+        SL.loc[SL.loc[:, "Capacity"] < cut_off, "system_type"] = "domestic"
+        SL.loc[SL.loc[:, "Capacity"] >= cut_off, "system_type"] = "non_domestic"
+        return SL
+
+    def type_indices(self):
+        """
+        Return the row indices of the sites of each system type.
+
+        Returns
+        -------
+        dict
+            The row indices keyed by "domestic" and "non_domestic".
+        """
+        if self._type_indices is None:
+            self._type_indices = {
+                system_type: np.flatnonzero(self.system_type_code == code)
+                for system_type, code in SYSTEM_TYPE_CODES.items()
+            }
+        return self._type_indices
+
+    def band_indices(self):
+        """
+        Return the row indices of the sites in each unreported capacity band.
+
+        Returns
+        -------
+        dict
+            The row indices keyed by the band names used in the "unreported"
+            capacity error config.
+        """
+        if self._band_indices is None:
+            capacity = self.capacity
+            masks = {
+                "0to4": capacity < 4,
+                "4to10": (4 < capacity) & (capacity <= 10),
+                "10to50": (10 < capacity) & (capacity <= 40),
+                "50to5": (50 < capacity) & (capacity <= 5000),
+            }
+            self._band_indices = {band: np.flatnonzero(mask)
+                                  for band, mask in masks.items()}
+        return self._band_indices
+
+    def variant(self):
+        """
+        Return a site list for a single simulation.
+
+        Every column other than Capacity is shared with the base site list,
+        only the Capacity column is copied.
+
+        Returns
+        -------
+        pd.DataFrame
+            The site list with a private Capacity column.
+        """
+        return self.frame(self.capacity.copy())
+
+    def frame(self, capacity, rows=None):
+        """
+        Build a site list DataFrame from a capacity for each site.
+
+        Parameters
+        ----------
+        `capacity` : numpy.ndarray
+            The capacity of each site.
+        `rows` : numpy.ndarray
+            Optionally the base row of each site, for site lists with
+            duplicated rows. Defaults to the base site list itself.
+        Returns
+        -------
+        pd.DataFrame
+            The site list, with the index labels of the base rows.
+        """
+        if rows is None:
+            SL = self.static.copy(deep=False)
+            codes = self.system_type_code
+        else:
+            SL = self.static.take(rows)
+            codes = self.system_type_code[rows]
+        system_type = np.array([None, "domestic", "non_domestic"],
+                               dtype=object)[codes + 1]
+        SL.insert(self.columns.index("Capacity"), "Capacity", capacity)
+        SL.insert(self.columns.index("system_type"), "system_type",
+                  system_type)
+        return SL
 
 
 class SiteListVariation:
     """
     Modifying the site list in accordance with the
     categorised errors.
+
+    The simulation works on a private capacity array. Unreported sites are
+    held as the base rows they duplicate, and the site list DataFrame is
+    only built when `SL` is accessed.
     """
 
-    def __init__(self, simulation_id, verbose=False, seed=1, test=False):
-        self.config = self.load_config()
+    def __init__(self, simulation_id, verbose=False, seed=1, test=False,
+                 base=None, capacity_error=None, keyed_streams=False,
+                 parameters=None, sparse=False, threads=1, backend="auto"):
+        """
+        Parameters
+        ----------
+        `simulation_id` : int
+            An identifier for the simulation.
+        `seed` : int
+            The seed for the numpy random number generator.
+        `test` : bool
+            Test with a subset of 1000 sites, ignored if `base` is given.
+        `base` : BaseSiteList
+            Optionally provide a preloaded site list to share between
+            simulations, otherwise the site list is loaded from file.
+        `capacity_error` : CapacityError
+            Optionally provide a preloaded CapacityError instance.
+        `keyed_streams` : bool
+            Draw every random number from a counter-based stream keyed by
+            (seed, site id, error category) instead of the global numpy
+            random state, so that each site's outcome does not depend on
+            the rest of the site list or the order of the draws.
+        `parameters` : dict
+            Optionally fix the p1 parameter (the probability of each error
+            occurring) keyed by (error category, system type), instead of
+            drawing it from the capacity error config.
+        `sparse` : bool
+            Only draw the effect of each error for the sites it affects,
+            choosing them by a binomial count then sampling that many sites,
+            using a numpy Generator seeded with `seed`.
+        `threads` : int
+            With the keyed random streams, split the site list into this
+            many contiguous chunks simulated by a thread pool, which gives
+            the same per-site capacities as a single thread.
+        `backend` : string
+            The kernel applying each error stage with the global numpy
+            random state, "numpy", "numba" or "auto", see
+            `error_kernels.stage_kernel`. The backends give the same
+            capacities.
+        """
         self.verbose = verbose
         self.test = test # test with subset of 1000 sites
-        self.SL =self.load_site_list()
+        self.base = BaseSiteList(test=test) if base is None else base
+        self.config = self.base.config
+        self.capacity = np.array(self.base.capacity)
+        # the base rows duplicated as unreported sites
+        self.extra_rows = np.empty(0, dtype=np.int64)
+        # the id of every site, which keys its random streams
+        self.site_ids = self.base.site_id
+        self._system_types = None
         self.simulation_id = simulation_id
+        self.seed = seed
+        # the positions of the simulated sites, if only some are simulated
+        self.selection = None
         self.random_seed = np.random.seed(seed)
-        print(seed)
-        self.ce = ce()
+        if self.verbose: print("Seed: {}".format(seed))
+        self.ce = ce() if capacity_error is None else capacity_error
+        self.streams = RandomStreams(seed) if keyed_streams else None
+        self.parameters = {} if parameters is None else parameters
+        self.rng = np.random.default_rng(seed) if sparse else None
+        self.threads = int(threads)
+        self.stage_kernel = stage_kernel(backend)
+        # whether the last stage left a negative capacity, if its kernel
+        # tested for them
+        self.negative = None
+        if self.threads > 1 and not keyed_streams:
+            raise ValueError("Simulating chunks of the site list in threads "
+                             "requires the keyed random streams.")
+        self._type_rows = None
+        # the change in capacity of each stage keyed by (stage, system type)
+        self.breakdown = {}
+
+    @property
+    def rows(self):
+        """The base row of every site in the simulated site list."""
+        rows = np.concatenate((np.arange(self.base.capacity.shape[0]),
+                               self.extra_rows))
+        return rows if self.selection is None else rows[self.selection]
+
+    def site_capacities(self):
+        """
+        Return the base row and a copy of the capacity of every site in the
+        simulated site list.
+        """
+        return self.rows, self.capacity.copy()
+
+    @property
+    def SL(self):
+        """
+        The simulated site list as a DataFrame, built on each access.
+        """
+        rows = None if self.extra_rows.shape[0] == 0 and \
+            self.selection is None else self.rows
+        return self.base.frame(self.capacity.copy(), rows)
+
+    def national_capacity(self):
+        """
+        Return the national capacity of the simulated site list, skipping
+        sites with a missing capacity like the pandas sum of `SL`.
+        """
+        return np.nansum(self.capacity, dtype=np.float64)
+
+    def system_types(self):
+        """Return the system type code of every site."""
+        if self._system_types is None:
+            system_types = self.base.system_type_code
+            if self.extra_rows.shape[0] or self.selection is not None:
+                system_types = system_types[self.rows]
+            self._system_types = system_types
+        return self._system_types
+
+    def select_sites(self, positions):
+        """
+        Only simulate the sites at the given positions of the site list.
+
+        With the keyed random streams the outcome of each site does not
+        depend on the other sites simulated, so a selection of sites has the
+        same outcomes as in the simulation of the whole site list. Sites are
+        selected after the unreported sites have been added.
+
+        Parameters
+        ----------
+        `positions` : numpy.ndarray
+            The positions of the sites to keep.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        self.selection = positions if self.selection is None \
+            else self.selection[positions]
+        self.capacity = self.capacity[positions]
+        self.site_ids = self.site_ids[positions]
+        self._system_types = None
+        self._type_rows = None
+
+    def add_unreported_rows(self, rows):
+        """
+        Append duplicates of the given base rows as unreported sites, with
+        the id of the site they duplicate offset by UNREPORTED_ID.
+        """
+        if self.selection is not None:
+            raise Exception("Unreported sites must be added before sites "
+                            "are selected.")
+        self.extra_rows = np.concatenate((self.extra_rows, rows))
+        self.capacity = np.concatenate((self.capacity, self.capacity[rows]))
+        self.site_ids = np.concatenate((self.site_ids,
+                                        UNREPORTED_ID +
+                                        self.base.site_id[rows]))
+        self._system_types = None
+        self._type_rows = None
+
+    def type_capacities(self):
+        """Return the total capacity of each system type."""
+        totals = np.bincount(self.system_types() + 1, weights=self.capacity,
+                             minlength=len(SYSTEM_TYPE_CODES) + 1)
+        return {system_type: totals[code + 1]
+                for system_type, code in SYSTEM_TYPE_CODES.items()}
+
+    def record_change(self, stage, before):
+        """
+        Record the change in the capacity of each system type made by a
+        stage, given the `type_capacities` from before it.
+        """
+        after = self.type_capacities()
+        for system_type in SYSTEM_TYPE_CODES:
+            self.breakdown[(stage, system_type)] = \
+                after[system_type] - before[system_type]
 
     @staticmethod
     def load_config(file_location=None):
@@ -70,26 +499,52 @@ class SiteListVariation:
         # import pdb; pdb.set_trace()
         counts = self.ce.config["unreported"]
         # import pdb; pdb.set_trace()
+        before = self.type_capacities()
+        if self.streams is not None:
+            self.keyed_unreported_systems(counts)
+        else:
+            # the bands do not overlap, so sampling each from the base rows
+            # draws the same sites as sampling from the growing site list
+            band_indices = self.base.band_indices()
+            for band in ["0to4", "4to10", "10to50", "50to5"]:
+                rows = band_indices[band]
+                sample = np.random.choice(rows.shape[0], int(counts[band]),
+                                          replace=False)
+                self.add_unreported_rows(rows[sample])
+        self.record_change("unreported", before)
+
+    def keyed_unreported_systems(self, counts):
+        """
+        Augmenting the site list with unreported sites sampled using the
+        keyed random streams.
 
-        mask_0to4 = (self.SL["Capacity"] < 4)
-        self.SL = pd.concat((self.SL, self.SL.loc[mask_0to4].sample(int(counts["0to4"]))), axis=0)
-
-        mask_4to10 = (4 < self.SL["Capacity"]) & (self.SL["Capacity"] <= 10)
-        self.SL = pd.concat((self.SL, self.SL.loc[mask_4to10].sample(int(counts["4to10"]))), axis=0)
-
-        mask_10to50 = (10 < self.SL["Capacity"]) & (self.SL["Capacity"] <= 40)
-        self.SL = pd.concat((self.SL, self.SL.loc[mask_10to50].sample(int(counts["10to50"]))), axis=0)
-
-        mask_50to5 = (50 < self.SL["Capacity"]) & (self.SL["Capacity"] <= 5000)
-        self.SL = pd.concat((self.SL, self.SL.loc[mask_50to5].sample(int(counts["50to5"]))), axis=0)
+        The sites of each capacity band are sampled by their site ids and
+        follow the base site list in the order of the bands in the config,
+        then of their site ids, so they do not depend on the order of the
+        site list.
+        """
+        band_indices = self.base.band_indices()
+        rows = np.concatenate([
+            self.streams.sample("unreported_" + band, band_indices[band],
+                                int(counts[band]),
+                                ids=self.base.site_id[band_indices[band]])
+            for band in counts
+        ])
+        self.add_unreported_rows(rows)
 
     def test_negative(self, error):
         # import pdb; pdb.set_trace()
-        if sum(self.SL.Capacity < 0) > 0:
+        negative = (self.capacity < 0).any() if self.negative is None \
+            else self.negative
+        self.negative = None
+        if negative:
             raise Exception("Negative capacity values following error: {}"
                             .format(error))
 
     def simulate_effective_capacity_site_list(self):
+        if self.threads > 1:
+            self.simulate_chunks()
+            return
         if self.verbose: print("Initialising CapacityError object...\n")
         ce = self.ce
         if self.verbose: print("\t--> done.\n")
@@ -135,43 +590,220 @@ class SiteListVariation:
         self.test_negative("network outage")
         return
 
-    def apply_error(self, error_category, pdf):
+    def apply_error(self, error_category, pdf=None):
+        pdf = self.ce.error_pdf if pdf is None else pdf
+        before = self.type_capacities()
+        if self.streams is not None:
+            self.apply_keyed_error(error_category)
+        elif self.rng is not None:
+            self.apply_sparse_error(error_category)
+        else:
+            self.apply_global_error(error_category, pdf)
+        self.record_change(error_category, before)
+
+    def apply_global_error(self, error_category, pdf):
+        """
+        Apply an error using the global numpy random state.
+
+        Every random number of the stage is drawn first, in the same order
+        as testing and applying each system type in turn, then the stage
+        kernel applies the error to every site. The draws use the scipy
+        pdfs of `CapacityError.error_pdf` rather than the compiled
+        samplers, so that a seed gives the same site list as before.
+        """
         # domestic_count = self.SL.loc[self.SL["system_type"] == "domestic"].shape[0]
         # non_domestic_count = self.SL.loc[self.SL["system_type"] == "non_domestic"].shape[0]
-        system_count = self.SL.shape[0]
+        system_count = self.capacity.shape[0]
         system_types = ["domestic", "non_domestic"]
+        random_numbers = np.empty((len(system_types), system_count))
+        effects = np.empty((len(system_types), system_count))
+        probabilities = np.empty(len(system_types))
+        additive = np.zeros(len(system_types), dtype=bool)
         for system_type in system_types:
-            random_numbers = np.random.uniform(0, 1, system_count)
-            probability_error_occurs = pdf(system_type, order="p1", _error=error_category, size=1)[0]
+            code = SYSTEM_TYPE_CODES[system_type]
+            random_numbers[code] = np.random.uniform(0, 1, system_count)
+            if (error_category, system_type) in self.parameters:
+                probabilities[code] = self.parameters[(error_category, system_type)]
+            else:
+                probabilities[code] = pdf(system_type, order="p1", _error=error_category, size=1)[0]
             if error_category == "site_uncertainty" and system_type == "domestic":
-                effect_of_error = pdf(system_type, order="p2", _error=error_category, size=system_count, bounds = (0,1))
+                effects[code] = pdf(system_type, order="p2", _error=error_category, size=system_count, bounds = (0,1))
+                additive[code] = True
             else:
-                effect_of_error = pdf(system_type, order="p2", _error=error_category, size=system_count) + 1
-            mask = random_numbers < probability_error_occurs
-            sl_mask = (self.SL["system_type"] == system_type).values & mask
-            # import pdb; pdb.set_trace()
+                effects[code] = pdf(system_type, order="p2", _error=error_category, size=system_count) + 1
+        self.negative = self.stage_kernel(self.capacity, self.system_types(),
+                                          random_numbers, probabilities,
+                                          effects, additive)
+
+    def type_rows(self, system_type):
+        """Return the row positions of the sites of a system type."""
+        if self._type_rows is None:
+            system_type_values = self.system_types()
+            self._type_rows = {
+                system_type: np.flatnonzero(system_type_values == code)
+                for system_type, code in SYSTEM_TYPE_CODES.items()
+            }
+        return self._type_rows[system_type]
+
+    def apply_sparse_error(self, error_category):
+        """
+        Apply an error drawing only the sites it affects.
+
+        The number of affected sites of each system type is drawn from a
+        binomial distribution and that many sites are sampled without
+        replacement, which has the same distribution as testing every site
+        against the probability of the error occurring.
+        """
+        for system_type in ["domestic", "non_domestic"]:
+            rows = self.type_rows(system_type)
+            if (error_category, system_type) in self.parameters:
+                probability_error_occurs = \
+                    self.parameters[(error_category, system_type)]
+            else:
+                probability_error_occurs = self.ce.error_pdf(
+                    system_type, order="p1", _error=error_category, size=1,
+                    random_state=self.rng
+                )[0]
+            count = self.rng.binomial(
+                rows.shape[0], min(max(probability_error_occurs, 0), 1)
+            )
+            if count == 0:
+                continue
+            hit = rows[self.rng.choice(rows.shape[0], count, replace=False)]
             if error_category == "site_uncertainty" and system_type == "domestic":
-                self.SL.loc[sl_mask, "Capacity"] += effect_of_error[sl_mask]
-                # import pdb; pdb.set_trace()
+                effect_of_error = self.ce.error_pdf(
+                    system_type, order="p2", _error=error_category,
+                    size=count, bounds=(0, 1), random_state=self.rng
+                )
+                self.capacity[hit] += effect_of_error
             else:
-                self.SL.loc[sl_mask, "Capacity"] *= effect_of_error[sl_mask]
+                effect_of_error = self.ce.error_pdf(
+                    system_type, order="p2", _error=error_category,
+                    size=count, random_state=self.rng
+                ) + 1
+                self.capacity[hit] *= effect_of_error
 
+    def keyed_probability(self, error_category, system_type):
+        """
+        Return the probability of an error occurring for a system type, drawn
+        from the keyed random streams unless it is fixed.
+        """
+        if (error_category, system_type) in self.parameters:
+            return self.parameters[(error_category, system_type)]
+        return float(self.ce.error_ppf(
+            system_type, self.streams.parameter_uniform(error_category,
+                                                        system_type),
+            order="p1", _error=error_category
+        ))
+
+    def apply_keyed_error(self, error_category, chunk=slice(None),
+                          probabilities=None):
+        """
+        Apply an error using the keyed random streams.
 
-    def load_site_list(self, cut_off=10, n_rows=1000):
-        """Load the site list csv file into a pandas DataFrame."""
-        if self.test:
-            SL = pd.read_csv(self.config["sl_file"], nrows=n_rows)
-        else:
-            SL = pd.read_csv(self.config["sl_file"])
+        Each site has one pair of uniform random numbers per error category,
+        deciding whether the error occurs and the size of its effect, which
+        are mapped through the inverse cdfs of the capacity error config.
 
-        # rename site list columns
-        SL.rename({"dc_capacity" : "Capacity"}, inplace=True, axis=1)
+        Parameters
+        ----------
+        `error_category` : string
+            The error category.
+        `chunk` : slice
+            Optionally only apply the error to a contiguous chunk of sites.
+        `probabilities` : dict
+            Optionally the probability of the error occurring keyed by
+            system type, see `keyed_probability`.
+        """
+        capacity = self.capacity[chunk]
+        random_numbers, effect_uniforms = self.streams.site_uniforms(
+            error_category, self.site_ids[chunk]
+        )
+        system_type_values = self.system_types()[chunk]
+        for system_type in ["domestic", "non_domestic"]:
+            probability_error_occurs = \
+                self.keyed_probability(error_category, system_type) \
+                if probabilities is None else probabilities[system_type]
+            sl_mask = (system_type_values ==
+                       SYSTEM_TYPE_CODES[system_type]) & \
+                (random_numbers < probability_error_occurs)
+            if error_category == "site_uncertainty" and system_type == "domestic":
+                effect_of_error = self.ce.error_ppf(
+                    system_type, effect_uniforms[sl_mask], order="p2",
+                    _error=error_category, bounds=(0, 1)
+                )
+                capacity[sl_mask] += effect_of_error
+            else:
+                effect_of_error = self.ce.error_ppf(
+                    system_type, effect_uniforms[sl_mask], order="p2",
+                    _error=error_category
+                ) + 1
+                capacity[sl_mask] *= effect_of_error
+
+    def chunk_capacities(self, chunk):
+        """Return the capacity of each system type in a chunk of sites."""
+        return np.bincount(self.system_types()[chunk] + 1,
+                           weights=self.capacity[chunk],
+                           minlength=len(SYSTEM_TYPE_CODES) + 1)[1:]
+
+    def simulate_chunk(self, chunk, probabilities):
+        """
+        Apply every error stage to a contiguous chunk of sites.
 
-        # categorise systems as domestic / non-domestic
-        SL["system_type"] = None
-        SL.loc[SL.loc[:, "Capacity"] < cut_off, "system_type"] = "domestic"
-        SL.loc[SL.loc[:, "Capacity"] >= cut_off, "system_type"] = "non_domestic"
-        return SL
+        Returns
+        -------
+        dict
+            The change in the capacity of each system type in the chunk by
+            each stage, as an array keyed by stage.
+        """
+        changes = {}
+        if (self.capacity[chunk] < 0).any():
+            raise Exception("Negative capacity values following error: None")
+        for stage in ERROR_STAGES:
+            before = self.chunk_capacities(chunk)
+            self.apply_keyed_error(stage, chunk, probabilities[stage])
+            changes[stage] = self.chunk_capacities(chunk) - before
+            if (self.capacity[chunk] < 0).any():
+                raise Exception("Negative capacity values following error: "
+                                "{}".format(stage))
+        return changes
+
+    def simulate_chunks(self):
+        """
+        Simulate the site list in contiguous chunks in a thread pool.
+
+        With the keyed random streams each site's draws only depend on its
+        id, so the chunks are independent and the per-site capacities are
+        the same as simulating the whole site list in one thread. The
+        numpy kernels release the GIL, so the chunks run in parallel, and
+        the change in capacity by each stage is summed over the chunks.
+        """
+        if self.verbose: print("Simulating {} chunks...\n".format(self.threads))
+        # the p1 parameters are shared by every chunk
+        probabilities = {stage: {system_type: self.keyed_probability(
+                                     stage, system_type)
+                                 for system_type in SYSTEM_TYPE_CODES}
+                         for stage in ERROR_STAGES}
+        self.system_types()
+        edges = np.linspace(0, self.capacity.shape[0],
+                            self.threads + 1).astype(np.int64)
+        chunks = [slice(start, stop) for start, stop in zip(edges[:-1],
+                                                            edges[1:])]
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            changes = list(executor.map(
+                lambda chunk: self.simulate_chunk(chunk, probabilities),
+                chunks
+            ))
+        for stage in ERROR_STAGES:
+            total = np.sum([change[stage] for change in changes], axis=0)
+            for system_type, code in SYSTEM_TYPE_CODES.items():
+                self.breakdown[(stage, system_type)] = total[code]
+
+    def load_site_list(self, cut_off=10, n_rows=1000):
+        """Load the site list csv file into a pandas DataFrame."""
+        return BaseSiteList.read_site_list(self.config["sl_file"],
+                                           test=self.test, cut_off=cut_off,
+                                           n_rows=n_rows)
 
 if __name__ == "__main__":
     self = SiteListVariation(1, verbose=True, seed=1, test=False)
@@ -0,0 +1,67 @@
+"""
+Test functions for batch_site_list_variation.py, whose columns should each
+only depend on their own seed.
+"""
+
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+import batch_site_list_variation
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList
+from batch_site_list_variation import BatchSiteListVariation
+
+
+def capacity_error():
+    """The capacity error config, with few unreported sites."""
+    file = os.path.join(os.path.dirname(os.path.abspath(
+        batch_site_list_variation.__file__)), "Config",
+        "capacity_error.txt")
+    config = CapacityError.load_config(file)
+    config["unreported"] = {"0to4": 100, "4to10": 40, "10to50": 10,
+                            "50to5": 5}
+    return CapacityError(config=config)
+
+
+@pytest.fixture
+def base(tmp_path):
+    """A small site list with two missing capacities."""
+    rng = np.random.default_rng(0)
+    capacity = np.concatenate((rng.uniform(0.5, 10, 2000),
+                               rng.uniform(10, 40, 50),
+                               rng.uniform(50, 5000, 50)))
+    capacity[[7, 2050]] = np.nan
+    file = tmp_path / "site_list.csv"
+    pd.DataFrame({"dc_capacity": capacity,
+                  "install_date": "2015-01-01"}).to_csv(file, index=False)
+    return BaseSiteList(config={"sl_file": str(file)})
+
+
+def simulate(base, seeds):
+    instance = BatchSiteListVariation(seeds, base=base,
+                                      capacity_error=capacity_error())
+    instance.unreported_systems()
+    return instance, instance.simulate_effective_capacity_site_list()
+
+
+class TestBatch:
+
+    def test_missing_capacity(self, base):
+        instance, totals = simulate(base, [1, 2, 3, 4])
+        assert np.isfinite(totals).all()
+        changes = sum(instance.breakdown.values())
+        np.testing.assert_allclose(totals, np.nansum(base.capacity) + changes,
+                                   rtol=1e-12)
+
+    def test_column_matches_single_seed(self, base):
+        batch, totals = simulate(base, [5, 6, 7])
+        single, total = simulate(base, [6])
+        assert total[0] == totals[1]
+        np.testing.assert_array_equal(single.site_capacities()[1],
+                                      batch.site_capacities(1)[1])
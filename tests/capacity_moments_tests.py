@@ -0,0 +1,58 @@
+"""
+Test functions for capacity_moments.py: the mean national capacity of every
+engine should agree with the analytic approximation.
+"""
+
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+import capacity_moments
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList
+from capacity_moments import CapacityMoments, validate
+from site_list_monte_carlo_simuation import simulate_national_capacities
+
+ENGINES = [{}, {"sparse": True}, {"keyed_streams": True},
+           {"national_total": True}, {"batch": True}]
+
+
+def capacity_error():
+    """The capacity error config, with few unreported sites."""
+    file = os.path.join(os.path.dirname(os.path.abspath(
+        capacity_moments.__file__)), "Config", "capacity_error.txt")
+    config = CapacityError.load_config(file)
+    config["unreported"] = {"0to4": 100, "4to10": 40, "10to50": 10,
+                            "50to5": 5}
+    return CapacityError(config=config)
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory):
+    """A small site list."""
+    rng = np.random.default_rng(0)
+    file = tmp_path_factory.mktemp("site_list") / "site_list.csv"
+    pd.DataFrame({"dc_capacity": np.concatenate((rng.uniform(0.5, 10, 2000),
+                                                 rng.uniform(10, 40, 50),
+                                                 rng.uniform(50, 5000, 50))),
+                  "install_date": "2015-01-01"}).to_csv(file, index=False)
+    return BaseSiteList(config={"sl_file": str(file)})
+
+
+class TestMean:
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_engine_mean(self, base, engine):
+        ce = capacity_error()
+        moments = CapacityMoments(base, ce, n_points=1024)
+        results = simulate_national_capacities(list(range(1, 201)), 0, base,
+                                               ce, **engine)
+        frame = pd.DataFrame({"national_capacity_MW":
+                              [capacity for capacity, _ in results]})
+        comparison = validate(moments, frame).set_index("statistic")
+        assert abs(comparison.loc["mean", "standard_errors"]) < 4
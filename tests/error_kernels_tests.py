@@ -0,0 +1,110 @@
+"""
+Test functions comparing the NumPy and Numba kernels of error_kernels.py,
+which should give identical capacities on fixed seeds.
+"""
+
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+import error_kernels
+from error_kernels import apply_stage_numpy, apply_stage_loop, stage_kernel
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList, SiteListVariation
+
+
+def stage_inputs(seed, n=1000, dtype=np.float64):
+    """Random inputs for a stage kernel, with missing capacities."""
+    rng = np.random.default_rng(seed)
+    capacity = rng.uniform(0, 20, n).astype(dtype)
+    capacity[rng.random(n) < 0.05] = np.nan
+    codes = np.where(capacity < 10, 0, 1).astype(np.int8)
+    codes[np.isnan(capacity)] = -1
+    random_numbers = rng.random((2, n))
+    probabilities = np.array([0.3, 0.6])
+    effects = rng.normal(1, 0.5, (2, n))
+    additive = np.array([True, False])
+    return capacity, codes, random_numbers, probabilities, effects, additive
+
+
+def capacity_error():
+    """The capacity error config from the source directory."""
+    file = os.path.join(os.path.dirname(os.path.abspath(
+        error_kernels.__file__)), "Config", "capacity_error.txt")
+    return CapacityError(config=CapacityError.load_config(file))
+
+
+@pytest.fixture
+def base(tmp_path):
+    """A small site list."""
+    rng = np.random.default_rng(0)
+    n = 2000
+    file = tmp_path / "site_list.csv"
+    pd.DataFrame({"dc_capacity": np.concatenate((rng.uniform(0.5, 10, n),
+                                                 rng.uniform(10, 5000, 50))),
+                  "install_date": "2015-01-01"}).to_csv(file, index=False)
+    return BaseSiteList(config={"sl_file": str(file)})
+
+
+def simulate(base, seed, backend):
+    instance = SiteListVariation(0, seed=seed, base=base,
+                                 capacity_error=capacity_error(),
+                                 backend=backend)
+    instance.simulate_effective_capacity_site_list()
+    return instance
+
+
+class TestStageKernel:
+
+    @pytest.mark.parametrize("dtype", [np.float64, np.float32])
+    def test_loop_matches_numpy(self, dtype):
+        for seed in range(3):
+            expected = stage_inputs(seed, n=300, dtype=dtype)
+            actual = stage_inputs(seed, n=300, dtype=dtype)
+            expected_negative = apply_stage_numpy(*expected)
+            actual_negative = apply_stage_loop(*actual)
+            np.testing.assert_array_equal(actual[0], expected[0])
+            assert actual_negative == expected_negative
+
+    @pytest.mark.parametrize("dtype", [np.float64, np.float32])
+    def test_numba_matches_numpy(self, dtype):
+        pytest.importorskip("numba")
+        for seed in range(5):
+            expected = stage_inputs(seed, dtype=dtype)
+            actual = stage_inputs(seed, dtype=dtype)
+            expected_negative = apply_stage_numpy(*expected)
+            actual_negative = error_kernels.apply_stage_numba(*actual)
+            np.testing.assert_array_equal(actual[0], expected[0])
+            assert actual_negative == expected_negative
+
+    def test_fallback_without_numba(self, monkeypatch):
+        monkeypatch.setattr(error_kernels, "numba", None)
+        assert stage_kernel("auto") is apply_stage_numpy
+        with pytest.raises(ImportError):
+            stage_kernel("numba")
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            stage_kernel("cuda")
+
+
+class TestSiteListBackends:
+
+    @pytest.mark.parametrize("seed", [1, 2, 3])
+    def test_numba_matches_numpy(self, base, seed):
+        pytest.importorskip("numba")
+        expected = simulate(base, seed, "numpy")
+        actual = simulate(base, seed, "numba")
+        np.testing.assert_array_equal(actual.capacity, expected.capacity)
+        assert actual.national_capacity() == expected.national_capacity()
+
+    @pytest.mark.parametrize("seed", [1, 2, 3])
+    def test_auto_matches_numpy(self, base, seed):
+        expected = simulate(base, seed, "numpy")
+        actual = simulate(base, seed, "auto")
+        np.testing.assert_array_equal(actual.capacity, expected.capacity)
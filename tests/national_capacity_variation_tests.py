@@ -0,0 +1,74 @@
+"""
+Test functions for national_capacity_variation.py, whose national capacity
+should have the same distribution as the per-site simulation's.
+"""
+
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+import national_capacity_variation
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList
+from national_capacity_variation import NationalCapacityVariation
+from site_list_monte_carlo_simuation import simulate_national_capacities
+
+
+def capacity_error():
+    """The capacity error config, with few unreported sites."""
+    file = os.path.join(os.path.dirname(os.path.abspath(
+        national_capacity_variation.__file__)), "Config",
+        "capacity_error.txt")
+    config = CapacityError.load_config(file)
+    config["unreported"] = {"0to4": 100, "4to10": 40, "10to50": 10,
+                            "50to5": 5}
+    return CapacityError(config=config)
+
+
+@pytest.fixture
+def base(tmp_path):
+    """A small site list with two missing capacities."""
+    rng = np.random.default_rng(0)
+    capacity = np.concatenate((rng.uniform(0.5, 10, 2000),
+                               rng.uniform(10, 40, 50),
+                               rng.uniform(50, 5000, 50)))
+    capacity[[7, 2050]] = np.nan
+    file = tmp_path / "site_list.csv"
+    pd.DataFrame({"dc_capacity": capacity,
+                  "install_date": "2015-01-01"}).to_csv(file, index=False)
+    return BaseSiteList(config={"sl_file": str(file)})
+
+
+class TestMissingCapacity:
+
+    @pytest.mark.parametrize("seed", [1, 2, 3])
+    def test_national_capacity(self, base, seed):
+        ce = capacity_error()
+        instance = NationalCapacityVariation(seed, base=base,
+                                             capacity_error=ce)
+        instance.unreported_systems()
+        total = instance.simulate_effective_capacity_site_list()
+        _, capacity = instance.site_capacities()
+        assert np.isfinite(total)
+        assert total == pytest.approx(np.nansum(capacity), rel=1e-12)
+        assert total == pytest.approx(
+            np.nansum(base.capacity) + sum(instance.breakdown.values()),
+            rel=1e-12)
+
+    def test_matches_per_site_engine(self, base):
+        ce = capacity_error()
+        seeds = list(range(100, 160))
+        expected = np.array([result[0] for result in
+                             simulate_national_capacities(seeds, 0, base, ce)])
+        actual = np.array([result[0] for result in
+                           simulate_national_capacities(seeds, 0, base, ce,
+                                                        national_total=True)])
+        assert np.isfinite(actual).all() and np.isfinite(expected).all()
+        se = np.sqrt(expected.var(ddof=1) / len(seeds) +
+                     actual.var(ddof=1) / len(seeds))
+        assert abs(actual.mean() - expected.mean()) < 4 * se
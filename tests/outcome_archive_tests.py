@@ -0,0 +1,120 @@
+"""
+Test functions for outcome_archive.py: an archived simulation should decode
+to the per-site capacities it was saved from, with every engine.
+"""
+
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+import outcome_archive
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList
+from sampling_designs import p1_parameters
+from outcome_archive import (OutcomeArchive, encode_positions,
+                             decode_positions, engine_options)
+from site_list_monte_carlo_simuation import simulation_engine
+
+ENGINES = [{}, {"sparse": True}, {"keyed_streams": True},
+           {"national_total": True}, {"batch": True}]
+
+
+def capacity_error():
+    """The capacity error config, with few unreported sites."""
+    file = os.path.join(os.path.dirname(os.path.abspath(
+        outcome_archive.__file__)), "Config", "capacity_error.txt")
+    config = CapacityError.load_config(file)
+    config["unreported"] = {"0to4": 100, "4to10": 40, "10to50": 10,
+                            "50to5": 5}
+    return CapacityError(config=config)
+
+
+@pytest.fixture
+def base(tmp_path):
+    """A small site list, with a missing capacity."""
+    rng = np.random.default_rng(0)
+    file = tmp_path / "site_list.csv"
+    frame = pd.DataFrame({
+        "dc_capacity": np.concatenate((rng.uniform(0.5, 10, 2000),
+                                       rng.uniform(10, 40, 50),
+                                       rng.uniform(50, 5000, 50))),
+        "install_date": "2015-01-01"})
+    frame.loc[7, "dc_capacity"] = np.nan
+    frame.to_csv(file, index=False)
+    return BaseSiteList(config={"sl_file": str(file)})
+
+
+def simulate(seed, options, base, ce, parameters=None):
+    """The base rows and capacities of every site of a simulation."""
+    sl_rvs = simulation_engine(seed, engine_options(options), base, ce,
+                               parameters=parameters)
+    sl_rvs.unreported_systems()
+    sl_rvs.simulate_effective_capacity_site_list()
+    rows, capacity = sl_rvs.site_capacities()
+    return rows, np.asarray(capacity, dtype=np.float64)
+
+
+class TestPositions:
+
+    @pytest.mark.parametrize("positions", [
+        [], [0], [3, 4, 300, 70000], [5, 2 ** 40]])
+    def test_round_trip(self, positions):
+        positions = np.array(positions, dtype=np.int64)
+        gaps = encode_positions(positions)
+        assert gaps.dtype.kind == "u"
+        np.testing.assert_array_equal(decode_positions(gaps), positions)
+
+    def test_smallest_type(self):
+        assert encode_positions(np.array([10, 265])).dtype == np.uint8
+        assert encode_positions(np.array([10, 300])).dtype == np.uint16
+
+
+class TestArchive:
+
+    @pytest.mark.parametrize("options", ENGINES)
+    def test_decode(self, base, tmp_path, options):
+        ce = capacity_error()
+        archive = OutcomeArchive(str(tmp_path / "archive"), base, ce)
+        expected = {}
+        for seed in (3, 4):
+            expected[seed] = simulate(seed, options, base, ce)
+            archive.add(seed, *expected[seed], options=options)
+        assert archive.seeds() == [3, 4]
+        sites = np.array([0, 7, 1000, 2099, 2100, 2150])
+        for seed, (rows, capacity) in expected.items():
+            actual_rows, actual = archive.decode(seed)
+            np.testing.assert_array_equal(actual_rows, rows)
+            np.testing.assert_array_equal(actual, capacity)
+            actual_rows, actual = archive.decode(seed, sites)
+            np.testing.assert_array_equal(actual_rows, rows[sites])
+            np.testing.assert_array_equal(actual, capacity[sites])
+
+    @pytest.mark.parametrize("options", [{}, {"keyed_streams": True}])
+    def test_decode_parameters(self, base, tmp_path, options):
+        ce = capacity_error()
+        parameters = p1_parameters(ce, 1, method="sobol", seed=0,
+                                   replicates=1)[0]
+        archive = OutcomeArchive(str(tmp_path / "archive"), base, ce)
+        rows, capacity = simulate(5, options, base, ce, parameters)
+        archive.add(5, rows, capacity, options=options,
+                    parameters=parameters)
+        np.testing.assert_array_equal(archive.decode(5)[1], capacity)
+        frame = archive.site_list(5)
+        np.testing.assert_array_equal(frame["Capacity"].to_numpy(),
+                                      capacity)
+
+    def test_other_site_list(self, base, tmp_path):
+        ce = capacity_error()
+        archive = OutcomeArchive(str(tmp_path / "archive"), base, ce)
+        archive.add(3, *simulate(3, {}, base, ce))
+        file = tmp_path / "other.csv"
+        pd.DataFrame({"dc_capacity": [2., 3.],
+                      "install_date": "2015-01-01"}).to_csv(file, index=False)
+        other = BaseSiteList(config={"sl_file": str(file)})
+        with pytest.raises(ValueError):
+            OutcomeArchive(str(tmp_path / "archive"), other, ce)
@@ -0,0 +1,86 @@
+"""
+Test functions for sampling_designs.py: the uniform designs, the weights of
+the importance design and the variance reduction estimate.
+"""
+
+import os
+import sys
+import warnings
+import pytest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+from sampling_designs import (block_size, uniform_design, importance_design,
+                              variance_reduction)
+
+METHODS = ["random", "antithetic", "latin_hypercube", "sobol"]
+
+
+class TestUniformDesign:
+
+    @pytest.mark.parametrize("method", METHODS)
+    @pytest.mark.parametrize("N", [1, 7, 100])
+    def test_shape(self, method, N):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            design = uniform_design(method, N, 3, seed=0)
+        assert design.shape == (N, 3)
+        assert np.all((design > 0) & (design < 1))
+
+    @pytest.mark.parametrize("method", METHODS)
+    def test_seeded(self, method):
+        np.testing.assert_array_equal(uniform_design(method, 50, 3, seed=1),
+                                      uniform_design(method, 50, 3, seed=1))
+
+    def test_antithetic_pairs(self):
+        design = uniform_design("antithetic", 10, 3, seed=0)
+        np.testing.assert_allclose(design[0::2] + design[1::2], 1)
+
+    def test_latin_hypercube_strata(self):
+        design = uniform_design("latin_hypercube", 100, 3, seed=0,
+                                replicates=4)
+        size = block_size("latin_hypercube", 100, 4)
+        for block in design.reshape(-1, size, 3):
+            for column in block.T:
+                np.testing.assert_array_equal(
+                    np.sort(np.floor(column * size)), np.arange(size))
+
+    def test_sobol_block_size(self):
+        assert block_size("sobol", 100, 10) == 16
+        assert block_size("sobol", 64, 2) == 32
+
+    def test_unknown_method(self):
+        with pytest.raises(ValueError):
+            uniform_design("halton", 10, 3)
+
+
+class TestImportanceDesign:
+
+    def test_weights(self):
+        directions = np.array([0.6, 0.8, 0.])
+        design, weights = importance_design(20000, directions, seed=0)
+        assert design.shape == (20000, 3)
+        assert np.all((design > 0) & (design < 1))
+        assert weights.mean() == pytest.approx(1, abs=0.03)
+        # the weighted design is uniform
+        assert np.average(design, axis=0, weights=weights) == \
+            pytest.approx(0.5, abs=0.01)
+
+
+class TestVarianceReduction:
+
+    def test_linear_function(self):
+        N = 400
+        results = {method: uniform_design(method, N, 3, seed=0).sum(axis=1)
+                   for method in ("latin_hypercube", "sobol", "antithetic")}
+        assert variance_reduction(results["latin_hypercube"],
+                                  "latin_hypercube") > 10
+        assert variance_reduction(results["sobol"], "sobol") > 10
+        # antithetic pairs of a linear function have constant means
+        assert variance_reduction(results["antithetic"], "antithetic") > 1e6
+
+    def test_single_block(self):
+        assert np.isnan(variance_reduction(np.arange(10.), "latin_hypercube",
+                                           replicates=1))
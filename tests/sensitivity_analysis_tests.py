@@ -0,0 +1,52 @@
+"""
+Test functions for sensitivity_analysis.py: the Sobol indices of the
+Ishigami function, which are known analytically.
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+from sensitivity_analysis import saltelli_design, sobol_indices
+
+# the first-order and total-effect indices of the Ishigami function with
+# a = 7 and b = 0.1
+ISHIGAMI_FIRST = [0.3139, 0.4424, 0.]
+ISHIGAMI_TOTAL = [0.5576, 0.4424, 0.2437]
+
+
+def ishigami(x, a=7., b=0.1):
+    return np.sin(x[:, 0]) + a * np.sin(x[:, 1]) ** 2 + \
+        b * x[:, 2] ** 4 * np.sin(x[:, 0])
+
+
+class TestSobolIndices:
+
+    def test_design(self):
+        bounds = np.array([[0., 1.], [10., 20.]])
+        design = saltelli_design(bounds, 64, seed=0)
+        assert design.shape == (64 * 4, 2)
+        A, B, AB = design[:64], design[64:128], design[128:]
+        # each AB_i is A with column i from B
+        np.testing.assert_array_equal(AB[:64, 0], B[:, 0])
+        np.testing.assert_array_equal(AB[:64, 1], A[:, 1])
+        np.testing.assert_array_equal(AB[64:, 1], B[:, 1])
+        assert np.all((design >= bounds[:, 0]) & (design <= bounds[:, 1]))
+
+    def test_ishigami(self):
+        bounds = np.tile([-np.pi, np.pi], (3, 1))
+        design = saltelli_design(bounds, 2 ** 14, seed=0)
+        first, total = sobol_indices(ishigami(design), 3)
+        np.testing.assert_allclose(first[0], ISHIGAMI_FIRST, atol=0.03)
+        np.testing.assert_allclose(total[0], ISHIGAMI_TOTAL, atol=0.03)
+
+    def test_translation_invariant(self):
+        bounds = np.tile([-np.pi, np.pi], (3, 1))
+        outputs = ishigami(saltelli_design(bounds, 2 ** 10, seed=0))
+        first, total = sobol_indices(outputs, 3)
+        shifted = sobol_indices(outputs + 1e5, 3)
+        np.testing.assert_allclose(shifted[0], first, atol=1e-6)
+        np.testing.assert_allclose(shifted[1], total, atol=1e-6)
@@ -0,0 +1,78 @@
+"""
+Test functions for site_list_monte_carlo_simuation.py: resuming an
+interrupted run should give the same results as an uninterrupted one.
+"""
+
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+import site_list_monte_carlo_simuation
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList
+from site_list_monte_carlo_simuation import MonteCarloSiteList
+from results_store import ResultsStore, load_results
+
+SEEDS = [11, 12, 13, 14, 15, 16, 17]
+
+
+def capacity_error():
+    """The capacity error config, with few unreported sites."""
+    file = os.path.join(os.path.dirname(os.path.abspath(
+        site_list_monte_carlo_simuation.__file__)), "Config",
+        "capacity_error.txt")
+    config = CapacityError.load_config(file)
+    config["unreported"] = {"0to4": 100, "4to10": 40, "10to50": 10,
+                            "50to5": 5}
+    return CapacityError(config=config)
+
+
+@pytest.fixture
+def base(tmp_path):
+    """A small site list."""
+    rng = np.random.default_rng(0)
+    file = tmp_path / "site_list.csv"
+    pd.DataFrame({"dc_capacity": np.concatenate((rng.uniform(0.5, 10, 2000),
+                                                 rng.uniform(10, 40, 50),
+                                                 rng.uniform(50, 5000, 50))),
+                  "install_date": "2015-01-01"}).to_csv(file, index=False)
+    return BaseSiteList(config={"sl_file": str(file)})
+
+
+def run(base, ce, out_dir, **options):
+    MonteCarloSiteList(seeds=SEEDS, n=2, out_dir=str(out_dir), base=base,
+                       capacity_error=ce, **options).run()
+    return load_results(str(out_dir)).sort_values("random_seed") \
+        .reset_index(drop=True)
+
+
+class TestResume:
+
+    @pytest.mark.parametrize("options", [
+        {}, {"sparse": True}, {"keyed_streams": True},
+        {"national_total": True}, {"batch": 3},
+        {"sampling": "latin_hypercube", "replicates": 2}])
+    def test_resume_matches_uninterrupted(self, base, tmp_path, options):
+        ce = capacity_error()
+        expected = run(base, ce, tmp_path / "uninterrupted", **options)
+        out_dir = tmp_path / "interrupted"
+        run(base, ce, out_dir, **options)
+        # interrupt the run after its first chunk of results
+        chunks = ResultsStore(str(out_dir)).chunks()
+        assert len(chunks) > 1
+        for chunk in chunks[1:]:
+            os.remove(chunk)
+        assert len(load_results(str(out_dir))) < len(SEEDS)
+        actual = run(base, ce, out_dir, **options)
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_resume_other_options(self, base, tmp_path):
+        ce = capacity_error()
+        run(base, ce, tmp_path, sparse=True)
+        with pytest.raises(FileExistsError):
+            run(base, ce, tmp_path, keyed_streams=True)
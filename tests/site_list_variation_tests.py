@@ -0,0 +1,117 @@
+"""
+Test functions for site_list_variation.py: the keyed random streams, whose
+outcome for each site should only depend on its site id, and site lists
+with missing capacities.
+"""
+
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "source"))
+
+import site_list_variation
+from capacity_error import CapacityError
+from site_list_variation import BaseSiteList, SiteListVariation
+from site_list_monte_carlo_simuation import simulate_national_capacity
+
+
+def capacity_error():
+    """The capacity error config, with few unreported sites."""
+    file = os.path.join(os.path.dirname(os.path.abspath(
+        site_list_variation.__file__)), "Config", "capacity_error.txt")
+    config = CapacityError.load_config(file)
+    config["unreported"] = {"0to4": 100, "4to10": 40, "10to50": 10,
+                            "50to5": 5}
+    return CapacityError(config=config)
+
+
+def site_list(tmp_path, name, order, missing=()):
+    """
+    A small site list with a site_id column, in the given row order, with
+    the capacity of the `missing` rows missing.
+    """
+    rng = np.random.default_rng(0)
+    n = 2000
+    frame = pd.DataFrame({
+        "site_id": rng.choice(10 ** 9, n + 100, replace=False),
+        "dc_capacity": np.concatenate((rng.uniform(0.5, 10, n),
+                                       rng.uniform(10, 40, 50),
+                                       rng.uniform(50, 5000, 50))),
+        "install_date": "2015-01-01",
+    })
+    frame.loc[list(missing), "dc_capacity"] = np.nan
+    file = tmp_path / name
+    frame.iloc[order].to_csv(file, index=False)
+    return BaseSiteList(config={"sl_file": str(file)})
+
+
+def outcomes(base, seed, ce, threads=1):
+    """The capacity of every site of a keyed simulation keyed by site id."""
+    instance = SiteListVariation(0, seed=seed, base=base, capacity_error=ce,
+                                 keyed_streams=True, threads=threads)
+    instance.unreported_systems()
+    instance.simulate_effective_capacity_site_list()
+    n_base = base.capacity.shape[0]
+    ids = base.site_id[instance.rows]
+    reported = pd.Series(instance.capacity[:n_base], index=ids[:n_base])
+    unreported = pd.Series(instance.capacity[n_base:], index=ids[n_base:])
+    return reported.sort_index(), unreported, instance.national_capacity()
+
+
+class TestKeyedSiteIds:
+
+    @pytest.mark.parametrize("seed", [1, 2])
+    def test_permuted_site_list(self, tmp_path, seed):
+        ce = capacity_error()
+        order = np.arange(2100)
+        base = site_list(tmp_path, "site_list.csv", order)
+        permuted = site_list(tmp_path, "permuted.csv",
+                             np.random.default_rng(seed).permutation(order))
+        assert not np.array_equal(base.site_id, permuted.site_id)
+        expected = outcomes(base, seed, ce)
+        actual = outcomes(permuted, seed, ce)
+        pd.testing.assert_series_equal(actual[0], expected[0])
+        # the unreported sites follow in the same order of site id
+        pd.testing.assert_series_equal(actual[1], expected[1])
+        assert actual[2] == pytest.approx(expected[2], rel=1e-12)
+
+    def test_threads_match(self, tmp_path):
+        ce = capacity_error()
+        base = site_list(tmp_path, "site_list.csv", np.arange(2100))
+        expected = outcomes(base, 3, ce)
+        actual = outcomes(base, 3, ce, threads=3)
+        pd.testing.assert_series_equal(actual[0], expected[0])
+        pd.testing.assert_series_equal(actual[1], expected[1])
+
+    def test_duplicate_site_ids(self, tmp_path):
+        file = tmp_path / "site_list.csv"
+        pd.DataFrame({"site_id": [1, 1], "dc_capacity": [2., 3.],
+                      "install_date": "2015-01-01"}).to_csv(file,
+                                                           index=False)
+        with pytest.raises(ValueError):
+            BaseSiteList(config={"sl_file": str(file)})
+
+
+class TestMissingCapacity:
+
+    @pytest.mark.parametrize("engine", [{}, {"sparse": True},
+                                        {"keyed_streams": True}])
+    def test_simulate_national_capacity(self, tmp_path, engine):
+        ce = capacity_error()
+        base = site_list(tmp_path, "site_list.csv", np.arange(2100),
+                         missing=[7, 2050])
+        assert np.isnan(base.capacity).sum() == 2
+        total, breakdown = simulate_national_capacity(4, 0, base, ce,
+                                                      **engine)
+        instance = SiteListVariation(0, seed=4, base=base,
+                                     capacity_error=ce, **engine)
+        instance.unreported_systems()
+        instance.simulate_effective_capacity_site_list()
+        assert np.isfinite(total)
+        assert total == pytest.approx(instance.SL["Capacity"].sum(),
+                                      rel=1e-12)
+        assert all(np.isfinite(change) for change in breakdown.values())